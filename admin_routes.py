@@ -12,7 +12,13 @@ import threading
 import time
 from datetime import datetime
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from vector_store import VectorStore
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from config import INDEXED_FOLDERS_FILE
 from google_auth_oauthlib.flow import Flow
 import pickle
@@ -30,66 +36,105 @@ from rate_limiter import limiter
 # Constants
 SHARED_DRIVE_ID = '0AMjLFg-ngmOAUk9PVA'  # 7MM Resources shared drive ID
 
+# indexed_folders.json is read on most admin requests; keep the parsed registry
+# and only re-read it when the file changes on disk
+_indexed_folders_cache = {'stamp': None, 'data': {}}
+_indexed_folders_lock = threading.Lock()
+
+
+def _load_indexed_folders():
+    """Return indexed_folders.json as a dict ({} if missing), re-parsing only when it changed"""
+    try:
+        stat = os.stat(INDEXED_FOLDERS_FILE)
+    except FileNotFoundError:
+        return {}
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    
+    with _indexed_folders_lock:
+        if _indexed_folders_cache['stamp'] != stamp:
+            with open(INDEXED_FOLDERS_FILE, 'rb') as f:
+                raw = f.read()
+            _indexed_folders_cache['data'] = orjson.loads(raw) if orjson else json.loads(raw)
+            _indexed_folders_cache['stamp'] = stamp
+        # Callers edit entries in place before saving - hand out copies
+        return {
+            folder_id: dict(info) if isinstance(info, dict) else info
+            for folder_id, info in _indexed_folders_cache['data'].items()
+        }
+
+
+def _save_indexed_folders(indexed_folders):
+    """Write indexed_folders.json atomically (temp file + os.replace) and drop the cached copy"""
+    if orjson:
+        payload = orjson.dumps(indexed_folders, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(indexed_folders, indent=2, ensure_ascii=False).encode('utf-8')
+    
+    tmp_path = f"{INDEXED_FOLDERS_FILE}.tmp"
+    with _indexed_folders_lock:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, INDEXED_FOLDERS_FILE)
+        _indexed_folders_cache['stamp'] = None
+
 # Helper functions for indexing
 def get_all_files_recursive_from_folder(folder_id, drive_service, depth=0):
-    """Recursively get ALL files from folder and all its subfolders"""
+    """Get ALL files from folder and all its subfolders (breadth-first, no recursion)"""
     all_files = []
-    indent = "  " * depth
+    # (folder_id, depth) still to list - a deque keeps deep trees off the call stack
+    pending = deque([(folder_id, depth)])
     
-    try:
-        # Query for ALL items (files and folders) in this specific folder
-        query = f"'{folder_id}' in parents and trashed=false"
-        page_token = None
-        
-        while True:
-            # Use safe_drive_call for retry logic
-            def make_request():
-                return drive_service.files().list(
-                    q=query,
-                    supportsAllDrives=True,
-                    includeItemsFromAllDrives=True,
-                    pageSize=1000,
-                    pageToken=page_token,
-                    fields='files(id, name, mimeType, modifiedTime, size), nextPageToken'
-                ).execute()
+    while pending:
+        current_id, current_depth = pending.popleft()
+        indent = "  " * current_depth
+        
+        try:
+            # Query for ALL items (files and folders) in this specific folder
+            query = f"'{current_id}' in parents and trashed=false"
+            page_token = None
             
-            response = safe_drive_call(make_request)
-            if not response:
-                break
+            while True:
+                # Use safe_drive_call for retry logic
+                def make_request():
+                    return drive_service.files().list(
+                        q=query,
+                        supportsAllDrives=True,
+                        includeItemsFromAllDrives=True,
+                        pageSize=1000,
+                        pageToken=page_token,
+                        fields='files(id, name, mimeType, modifiedTime, size), nextPageToken'
+                    ).execute()
                 
-            items = response.get('files', [])
-            
-            # Debug: Log what we're finding at each level
-            if depth < 2:  # Only log first 2 levels to avoid spam
-                files_count = sum(1 for item in items if item['mimeType'] != 'application/vnd.google-apps.folder')
-                folders_count = sum(1 for item in items if item['mimeType'] == 'application/vnd.google-apps.folder')
-                update_status(
-                    logs=indexing_status['logs'] + [f'{indent}🔍 Level {depth}: Found {files_count} files, {folders_count} folders in folder {folder_id}']
-                )
-            
-            for item in items:
-                if item['mimeType'] == 'application/vnd.google-apps.folder':
-                    # Recursively get files from subfolder
-                    try:
-                        subfolder_files = get_all_files_recursive_from_folder(item['id'], drive_service, depth + 1)
-                        all_files.extend(subfolder_files)
-                    except Exception as subfolder_error:
-                        update_status(
-                            logs=indexing_status['logs'] + [f'    ⚠️ Subfolder error at depth {depth}: {str(subfolder_error)[:100]}']
-                        )
-                        continue
-                else:
-                    # It's a file, add it
-                    all_files.append(item)
-            
-            page_token = response.get('nextPageToken')
-            if not page_token:
-                break
-    
-    except Exception as e:
-        update_status(
-            logs=indexing_status['logs'] + [f'  ⚠️ Error listing files in folder {folder_id} at depth {depth}: {str(e)[:100]}']
-        )
+                response = safe_drive_call(make_request)
+                if not response:
+                    break
+                    
+                items = response.get('files', [])
+                
+                # Debug: Log what we're finding at each level
+                if current_depth < 2:  # Only log first 2 levels to avoid spam
+                    folders_count = sum(1 for item in items if item['mimeType'] == 'application/vnd.google-apps.folder')
+                    files_count = len(items) - folders_count
+                    update_status(
+                        log=f'{indent}🔍 Level {current_depth}: Found {files_count} files, {folders_count} folders in folder {current_id}'
+                    )
+                
+                for item in items:
+                    if item['mimeType'] == 'application/vnd.google-apps.folder':
+                        # Subfolder - list it after this level
+                        pending.append((item['id'], current_depth + 1))
+                    else:
+                        # It's a file, add it
+                        all_files.append(item)
+                
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+        
+        except Exception as e:
+            update_status(
+                log=f'  ⚠️ Error listing files in folder {current_id} at depth {current_depth}: {str(e)[:100]}'
+            )
     
     return all_files
 
@@ -105,7 +150,7 @@ def safe_drive_call(func, max_retries=3, backoff=2):
                 if attempt < max_retries - 1:
                     wait_time = backoff ** attempt
                     update_status(
-                        logs=indexing_status['logs'] + [f'  ⚠️ API error {e.resp.status}, retrying in {wait_time}s...']
+                        log=f'  ⚠️ API error {e.resp.status}, retrying in {wait_time}s...'
                     )
                     time.sleep(wait_time)
                     continue
@@ -114,7 +159,7 @@ def safe_drive_call(func, max_retries=3, backoff=2):
             if attempt < max_retries - 1:
                 wait_time = backoff ** attempt
                 update_status(
-                    logs=indexing_status['logs'] + [f'  ⚠️ Network error, retrying in {wait_time}s...']
+                    log=f'  ⚠️ Network error, retrying in {wait_time}s...'
                 )
                 time.sleep(wait_time)
                 continue
@@ -122,6 +167,34 @@ def safe_drive_call(func, max_retries=3, backoff=2):
     
     return None
 
+def list_shared_drive_root_folders(drive_service):
+    """List every folder directly under the shared drive root, following nextPageToken"""
+    folders = []
+    page_token = None
+    
+    while True:
+        response = safe_drive_call(lambda: drive_service.files().list(
+            q=f"'{SHARED_DRIVE_ID}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
+            driveId=SHARED_DRIVE_ID,
+            corpora='drive',
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+            fields='nextPageToken, files(id, name)',
+            orderBy='name',
+            pageSize=100,
+            pageToken=page_token
+        ).execute())
+        if not response:
+            break
+        
+        folders.extend(response.get('files', []))
+        
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    
+    return folders
+
 # Create admin blueprint
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -146,11 +219,36 @@ indexing_status = {
 
 indexing_lock = threading.Lock()
 
-def update_status(**kwargs):
-    """Thread-safe status update helper"""
+def _directory_size(path):
+    """Total size in bytes of the files under path (one scandir pass per directory)"""
+    total = 0
+    pending = [path]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue  # Removed while walking (e.g. Chroma compaction)
+        except OSError:
+            continue
+    return total
+
+
+def update_status(log=None, **kwargs):
+    """Thread-safe status update helper; `log` (a line or list of lines) is appended to the status log"""
     global indexing_status
     with indexing_lock:
         indexing_status.update(kwargs)
+        if log is not None:
+            if isinstance(log, str):
+                indexing_status['logs'].append(log)
+            else:
+                indexing_status['logs'].extend(log)
 
 @admin_bp.route('/dashboard')
 def admin_dashboard():
@@ -1400,18 +1498,16 @@ def rename_collection():
     folder_id = collection_name.replace('folder_', '')
 
     try:
-        if not os.path.exists('indexed_folders.json'):
+        if not os.path.exists(INDEXED_FOLDERS_FILE):
             return jsonify({'error': 'indexed_folders.json not found'}), 404
-        with open('indexed_folders.json', 'r') as f:
-            indexed_folders = json.load(f)
+        indexed_folders = _load_indexed_folders()
         if folder_id not in indexed_folders:
             return jsonify({'error': f'Collection {collection_name} not found'}), 404
 
         old_name = indexed_folders[folder_id].get('name', '')
         indexed_folders[folder_id]['name'] = new_name
         indexed_folders[folder_id]['path'] = new_name
-        with open('indexed_folders.json', 'w') as f:
-            json.dump(indexed_folders, f, indent=2)
+        _save_indexed_folders(indexed_folders)
 
         # Live registry (no restart needed for the chat picker)
         from chat_api import available_collections
@@ -1427,16 +1523,15 @@ def rename_collection():
         try:
             from vector_store import VectorStore
             vs = VectorStore(collection_name=collection_name)
-            existing = vs.collection.get(include=['metadatas'])
-            ids = existing.get('ids', [])
-            metas = existing.get('metadatas', [])
-            if ids:
+            # Page through the collection so large folders stay under
+            # Chroma's per-call batch limit
+            for ids, metas in vs.iter_metadata_pages():
                 for m in metas:
                     m['folder_name'] = new_name
                     if 'source' in m:
                         m['source'] = new_name
                 vs.collection.update(ids=ids, metadatas=metas)
-                chunks_updated = len(ids)
+                chunks_updated += len(ids)
         except Exception as meta_error:
             print(f"[!] Rename: chunk metadata update failed: {meta_error}")
 
@@ -1478,47 +1573,62 @@ def reset_indexing_status():
 def regenerate_indexed_folders():
     """Regenerate indexed_folders.json by scanning ChromaDB collections"""
     try:
-        import chromadb
+        from vector_store import get_client
         from config import CHROMA_PERSIST_DIR
         
         print("[+] Regenerating indexed_folders.json from ChromaDB collections...")
         
         # Connect to ChromaDB
-        client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+        client = get_client(CHROMA_PERSIST_DIR)
         collections = client.list_collections()
         
         print(f"[+] Found {len(collections)} collections in ChromaDB")
         
         indexed_folders = {}
         
+        folder_collections = []
         for collection in collections:
-            collection_name = collection.name
-            
             # Skip non-folder collections
-            if not collection_name.startswith('folder_'):
-                print(f"  ⏭️  Skipping non-folder collection: {collection_name}")
+            if not collection.name.startswith('folder_'):
+                print(f"  ⏭️  Skipping non-folder collection: {collection.name}")
                 continue
+            folder_collections.append(collection)
+        
+        def probe_collection(collection):
+            """Return (doc_count, sample_metadata, metadata_error) for one collection."""
+            doc_count = collection.count()
+            if doc_count == 0:
+                return doc_count, None, None
+            try:
+                results = collection.get(limit=1, include=['metadatas'])
+                if results and results['metadatas'] and len(results['metadatas']) > 0:
+                    return doc_count, results['metadatas'][0], None
+                return doc_count, None, None
+            except Exception as e:
+                return doc_count, None, e
+        
+        # Each probe is two Chroma reads; run them concurrently rather than
+        # paying the round-trips once per collection in sequence
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            probes = list(executor.map(probe_collection, folder_collections))
+        
+        for collection, (doc_count, sample_metadata, metadata_error) in zip(folder_collections, probes):
+            collection_name = collection.name
             
             # Extract folder_id from collection name
             folder_id = collection_name.replace('folder_', '')
             
-            # Get collection stats
-            doc_count = collection.count()
-            
             if doc_count == 0:
                 print(f"  ⚠️  Collection {collection_name} is empty - skipping")
                 continue
             
-            # Get sample metadata to extract folder info
-            try:
-                results = collection.get(limit=1, include=['metadatas'])
-                if results and results['metadatas'] and len(results['metadatas']) > 0:
-                    sample_metadata = results['metadatas'][0]
-                    folder_name = sample_metadata.get('file_path', 'Unknown').split('/')[0] or 'Unknown'
-                else:
-                    folder_name = f"Folder {folder_id}"
-            except Exception as e:
-                print(f"  ⚠️  Could not fetch metadata for {collection_name}: {e}")
+            # Use sample metadata to extract folder info
+            if metadata_error is not None:
+                print(f"  ⚠️  Could not fetch metadata for {collection_name}: {metadata_error}")
+                folder_name = f"Folder {folder_id}"
+            elif sample_metadata:
+                folder_name = sample_metadata.get('file_path', 'Unknown').split('/')[0] or 'Unknown'
+            else:
                 folder_name = f"Folder {folder_id}"
             
             # Create entry
@@ -1539,8 +1649,7 @@ def regenerate_indexed_folders():
             print(f"  ✅ Added: {folder_name} ({doc_count} chunks)")
         
         # Save to file
-        with open(INDEXED_FOLDERS_FILE, 'w') as f:
-            json.dump(indexed_folders, f, indent=2)
+        _save_indexed_folders(indexed_folders)
         
         print(f"[+] Successfully regenerated indexed_folders.json with {len(indexed_folders)} folders")
         
@@ -1565,27 +1674,29 @@ def regenerate_indexed_folders():
 def diagnose_collections():
     """Diagnose collection status - compare ChromaDB vs indexed_folders.json"""
     try:
-        import chromadb
+        from vector_store import get_client
         from config import CHROMA_PERSIST_DIR
         
         # Get ChromaDB collections
-        client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+        client = get_client(CHROMA_PERSIST_DIR)
         chroma_collections = client.list_collections()
         
+        folder_collections = [c for c in chroma_collections if c.name.startswith('folder_')]
+        
+        # Count concurrently: reads don't take Chroma's write lock
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            counts = list(executor.map(lambda c: c.count(), folder_collections))
+        
         chroma_info = {}
-        for collection in chroma_collections:
-            if collection.name.startswith('folder_'):
-                folder_id = collection.name.replace('folder_', '')
-                chroma_info[folder_id] = {
-                    'collection_name': collection.name,
-                    'document_count': collection.count()
-                }
+        for collection, document_count in zip(folder_collections, counts):
+            folder_id = collection.name.replace('folder_', '')
+            chroma_info[folder_id] = {
+                'collection_name': collection.name,
+                'document_count': document_count
+            }
         
         # Get indexed_folders.json
-        indexed_info = {}
-        if os.path.exists(INDEXED_FOLDERS_FILE):
-            with open(INDEXED_FOLDERS_FILE, 'r') as f:
-                indexed_info = json.load(f)
+        indexed_info = _load_indexed_folders()
         
         # Compare
         diagnosis = {
@@ -1667,13 +1778,7 @@ def get_migration_status():
         chroma_path = './chroma_db'
         db_exists = os.path.exists(chroma_path) and os.path.isdir(chroma_path)
         
-        db_size = 0
-        if db_exists:
-            for dirpath, dirnames, filenames in os.walk(chroma_path):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    if os.path.exists(fp):
-                        db_size += os.path.getsize(fp)
+        db_size = _directory_size(chroma_path) if db_exists else 0
         
         db_size_mb = db_size / (1024 * 1024)
         
@@ -1739,6 +1844,7 @@ def install_migration_packages():
     try:
         import subprocess
         import sys
+        from importlib import metadata
         
         packages = [
             'google-cloud-aiplatform==1.78.0',
@@ -1748,6 +1854,16 @@ def install_migration_packages():
         result = {'success': [], 'failed': []}
         
         for package in packages:
+            # Reading the installed version is a metadata lookup (no import),
+            # so pinned packages that are already present skip pip entirely
+            name, _, version = package.partition('==')
+            try:
+                if metadata.version(name) == version:
+                    result['success'].append(package)
+                    continue
+            except metadata.PackageNotFoundError:
+                pass
+            
             try:
                 subprocess.check_call([
                     sys.executable, '-m', 'pip', 'install', package
@@ -1816,23 +1932,10 @@ def list_available_folders():
             return jsonify({'error': 'Google Drive not authenticated'}), 503
         
         # Get root folders from shared drive
-        response = safe_drive_call(lambda: drive_service.files().list(
-            q=f"'{SHARED_DRIVE_ID}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            driveId=SHARED_DRIVE_ID,
-            corpora='drive',
-            supportsAllDrives=True,
-            includeItemsFromAllDrives=True,
-            fields='files(id, name)',
-            pageSize=100
-        ).execute())
-        
-        folders = response.get('files', [])
+        folders = list_shared_drive_root_folders(drive_service)
         
         # Check which folders are already indexed
-        indexed_folders = {}
-        if os.path.exists('indexed_folders.json'):
-            with open('indexed_folders.json', 'r') as f:
-                indexed_folders = json.load(f)
+        indexed_folders = _load_indexed_folders()
         
         folder_list = []
         for folder in folders:
@@ -1943,7 +2046,7 @@ def run_reindex_process(create_backup=True):
             update_status(
                 progress=10,
                 message='Creating database backup...',
-                logs=indexing_status['logs'] + ['Creating backup...']
+                log='Creating backup...'
             )
             
             backup_dir = './chroma_db_backups'
@@ -1955,26 +2058,28 @@ def run_reindex_process(create_backup=True):
             if os.path.exists(chroma_path):
                 shutil.copytree(chroma_path, backup_path)
                 update_status(
-                    logs=indexing_status['logs'] + [f'Backup created: {backup_path}']
+                    log=f'Backup created: {backup_path}'
                 )
         
         # Step 2: Clear database
         update_status(
             progress=30,
             message='Clearing old database...',
-            logs=indexing_status['logs'] + ['Clearing database...']
+            log='Clearing database...'
         )
         
         if os.path.exists(chroma_path):
             try:
                 # Try to close any open ChromaDB connections
                 import gc
+                from vector_store import release_clients
+                release_clients()
                 gc.collect()
                 
                 # Attempt to remove
                 shutil.rmtree(chroma_path)
                 update_status(
-                    logs=indexing_status['logs'] + ['Database cleared']
+                    log='Database cleared'
                 )
             except PermissionError as e:
                 raise Exception(
@@ -1990,7 +2095,7 @@ def run_reindex_process(create_backup=True):
             progress=100,
             message='Database cleared. Restart server to reindex with new embeddings.',
             completed_at=datetime.now().isoformat(),
-            logs=indexing_status['logs'] + [
+            log=[
                 'Reindex preparation complete',
                 'Next: Restart the server to begin reindexing with Vertex AI'
             ]
@@ -2004,7 +2109,7 @@ def run_reindex_process(create_backup=True):
             message='Reindex failed',
             error=str(e),
             completed_at=datetime.now().isoformat(),
-            logs=indexing_status['logs'] + [f'Error: {str(e)}']
+            log=f'Error: {str(e)}'
         )
     finally:
         # CRITICAL FIX: Ensure running is always reset even on unexpected errors
@@ -2034,7 +2139,7 @@ def run_single_folder_indexing(folder_id, folder_name):
         update_status(
             progress=10,
             message='Initializing components...',
-            logs=indexing_status['logs'] + ['✅ Google Drive service ready']
+            log='✅ Google Drive service ready'
         )
         
         # Initialize embedder (must match what the chat system queries with)
@@ -2049,7 +2154,7 @@ def run_single_folder_indexing(folder_id, folder_name):
                 embedder = LocalEmbedder()
                 embedder_name = 'Local'
             update_status(
-                logs=indexing_status['logs'] + [f'✅ Embedder initialized ({embedder_name})']
+                log=f'✅ Embedder initialized ({embedder_name})'
             )
         except Exception as e:
             raise Exception(f'Failed to initialize embedder: {str(e)}')
@@ -2059,21 +2164,18 @@ def run_single_folder_indexing(folder_id, folder_name):
             from document_loader import GoogleDriveLoader
             loader = GoogleDriveLoader(drive_service)
             update_status(
-                logs=indexing_status['logs'] + [f'✅ Google Drive loader initialized (OCR: {"enabled" if loader.ocr_service else "disabled"})']
+                log=f'✅ Google Drive loader initialized (OCR: {"enabled" if loader.ocr_service else "disabled"})'
             )
         except Exception as e:
             raise Exception(f'Failed to initialize loader: {str(e)}')
         
         # Load existing indexed folders
-        indexed_folders = {}
-        if os.path.exists('indexed_folders.json'):
-            with open('indexed_folders.json', 'r') as f:
-                indexed_folders = json.load(f)
+        indexed_folders = _load_indexed_folders()
         
         update_status(
             progress=15,
             message=f'Processing folder: {folder_name}...',
-            logs=indexing_status['logs'] + [f'📂 Processing: {folder_name}']
+            log=f'📂 Processing: {folder_name}'
         )
         
         # Create collection for this folder
@@ -2082,21 +2184,21 @@ def run_single_folder_indexing(folder_id, folder_name):
         vector_store = VectorStore(collection_name=collection_id)
         
         update_status(
-            logs=indexing_status['logs'] + [f'📊 Collection: {collection_id}']
+            log=f'📊 Collection: {collection_id}'
         )
         
         # Get ALL files recursively from this folder
         update_status(
             progress=20,
             message='Scanning files...',
-            logs=indexing_status['logs'] + [f'🔍 Listing files from folder ID: {folder_id} (including subfolders)...']
+            log=f'🔍 Listing files from folder ID: {folder_id} (including subfolders)...'
         )
         
         files = get_all_files_recursive_from_folder(folder_id, drive_service, 0)
         folder_file_count = len(files)
         
         update_status(
-            logs=indexing_status['logs'] + [f'📄 Found {folder_file_count} files']
+            log=f'📄 Found {folder_file_count} files'
         )
         
         if folder_file_count == 0:
@@ -2105,7 +2207,7 @@ def run_single_folder_indexing(folder_id, folder_name):
                 progress=100,
                 message='Folder is empty',
                 completed_at=datetime.now().isoformat(),
-                logs=indexing_status['logs'] + ['⚠️ No files to process']
+                log='⚠️ No files to process'
             )
             return
         
@@ -2120,9 +2222,64 @@ def run_single_folder_indexing(folder_id, folder_name):
         batch_metadatas = []
         batch_ids = []
 
-        # File tracker entries, written only for files whose batches all succeed
+        # File tracker entries, written as soon as a file's batch is stored so an
+        # interrupted run leaves an accurate record for the incremental sync
         pending_tracker = {}
         failed_file_ids = set()
+        files_succeeded = 0
+        tracker = None
+        try:
+            from file_tracker import FileTracker
+            tracker = FileTracker()
+        except Exception as tracker_error:
+            update_status(
+                log=f'⚠️ Tracker unavailable: {str(tracker_error)[:100]}'
+            )
+
+        def flush_batch():
+            """Embed and store the pending batch, then record its files in the tracker"""
+            nonlocal folder_chunks, files_succeeded, tracker
+            # Batches are only flushed between files, so each one holds whole files
+            batch_file_ids = list(dict.fromkeys(m['file_id'] for m in batch_metadatas))
+            try:
+                # add_documents converts numpy output to lists itself
+                batch_embeddings = embedder.embed_documents(batch_chunks)
+
+                vector_store.add_documents(
+                    documents=batch_chunks,
+                    metadatas=batch_metadatas,
+                    ids=batch_ids,
+                    embeddings=batch_embeddings
+                )
+
+                folder_chunks += len(batch_chunks)
+            except Exception as batch_error:
+                update_status(
+                    log=f'⚠️ Batch processing error: {str(batch_error)[:100]}'
+                )
+                failed_file_ids.update(batch_file_ids)
+                for fid in batch_file_ids:
+                    pending_tracker.pop(fid, None)
+                return
+            finally:
+                batch_chunks.clear()
+                batch_metadatas.clear()
+                batch_ids.clear()
+
+            for fid in batch_file_ids:
+                entry = pending_tracker.pop(fid, None)
+                if entry is None:
+                    continue  # File errored part-way through chunking
+                files_succeeded += 1
+                if tracker is None:
+                    continue
+                try:
+                    tracker.update_file_state(**entry)
+                except Exception as tracker_error:
+                    update_status(
+                        log=f'⚠️ Tracker update error: {str(tracker_error)[:100]}'
+                    )
+                    tracker = None  # Don't retry (and log) for every remaining file
         
         for file_idx, file in enumerate(files, 1):
             try:
@@ -2136,18 +2293,15 @@ def run_single_folder_indexing(folder_id, folder_name):
                     update_status(
                         progress=file_progress,
                         message=f'Processing files... ({file_idx}/{folder_file_count})',
-                        logs=indexing_status['logs'] + [f'[{file_idx}/{folder_file_count}] Processing: {file_name[:50]}...']
+                        log=f'[{file_idx}/{folder_file_count}] Processing: {file_name[:50]}...'
                     )
                 
                 # Extract text (same logic as full indexing)
                 text = None
                 try:
-                    if file_mime == 'application/vnd.google-apps.document':
-                        text = loader.export_google_doc(file_id)
-                    elif file_mime == 'application/vnd.google-apps.spreadsheet':
-                        text = loader.export_google_sheets(file_id)
-                    elif file_mime == 'application/vnd.google-apps.presentation':
-                        text = loader.export_google_slides(file_id)
+                    exporter = loader.workspace_exporters.get(file_mime)
+                    if exporter:
+                        text = exporter(file_id)
                     elif file_mime.startswith('application/vnd.google-apps'):
                         files_skipped += 1
                         continue
@@ -2177,6 +2331,8 @@ def run_single_folder_indexing(folder_id, folder_name):
                 
                 # Add to batch (file_name/folder_name are what rag_system reads;
                 # filename/source kept for older readers)
+                total_chunks = len(chunks)
+                modified_time = file.get('modifiedTime', '')
                 for i, chunk in enumerate(chunks):
                     batch_chunks.append(chunk)
                     batch_metadatas.append({
@@ -2188,9 +2344,9 @@ def run_single_folder_indexing(folder_id, folder_name):
                         'folder_id': folder_id,
                         'mime_type': file_mime,
                         'chunk_index': i,
-                        'total_chunks': len(chunks),
+                        'total_chunks': total_chunks,
                         'text_length': len(chunk),
-                        'modified_time': file.get('modifiedTime', '')
+                        'modified_time': modified_time
                     })
                     batch_ids.append(f"{file_id}_chunk_{i}")
 
@@ -2207,55 +2363,16 @@ def run_single_folder_indexing(folder_id, folder_name):
                 }
 
                 # Process batch
-                if len(batch_chunks) >= BATCH_SIZE or file_idx == folder_file_count:
-                    try:
-                        batch_embeddings = embedder.embed_documents(batch_chunks)
-                        if hasattr(batch_embeddings, 'tolist'):
-                            batch_embeddings = batch_embeddings.tolist()
-
-                        vector_store.add_documents(
-                            documents=batch_chunks,
-                            metadatas=batch_metadatas,
-                            ids=batch_ids,
-                            embeddings=batch_embeddings
-                        )
-
-                        folder_chunks += len(batch_chunks)
-
-                        # Clear batch
-                        batch_chunks.clear()
-                        batch_metadatas.clear()
-                        batch_ids.clear()
-
-                    except Exception as batch_error:
-                        update_status(
-                            logs=indexing_status['logs'] + [f'⚠️ Batch processing error: {str(batch_error)[:100]}']
-                        )
-                        failed_file_ids.update(m['file_id'] for m in batch_metadatas)
-                        batch_chunks.clear()
-                        batch_metadatas.clear()
-                        batch_ids.clear()
-                        continue
+                if len(batch_chunks) >= BATCH_SIZE:
+                    flush_batch()
 
             except Exception as file_error:
                 files_failed += 1
                 continue
 
-        # Record successfully indexed files in the tracker so incremental
-        # sync skips them instead of re-embedding everything
-        files_succeeded = 0
-        try:
-            from file_tracker import FileTracker
-            tracker = FileTracker()
-            for fid, entry in pending_tracker.items():
-                if fid not in failed_file_ids:
-                    tracker.update_file_state(**entry)
-                    files_succeeded += 1
-        except Exception as tracker_error:
-            update_status(
-                logs=indexing_status['logs'] + [f'⚠️ Tracker update error: {str(tracker_error)[:100]}']
-            )
-            files_succeeded = len(pending_tracker) - len(failed_file_ids)
+        # Store the trailing partial batch (the last files may have been skipped)
+        if batch_chunks:
+            flush_batch()
         files_failed += len(failed_file_ids)
 
         # Save folder info
@@ -2273,15 +2390,14 @@ def run_single_folder_indexing(folder_id, folder_name):
         }
         
         # Save to file
-        with open('indexed_folders.json', 'w') as f:
-            json.dump(indexed_folders, f, indent=2)
+        _save_indexed_folders(indexed_folders)
         
         update_status(
             running=False,
             progress=100,
             message=f'Completed indexing {folder_name}',
             completed_at=datetime.now().isoformat(),
-            logs=indexing_status['logs'] + [
+            log=[
                 f'✅ COMPLETED: {folder_name}',
                 f'📊 Stats: {files_succeeded} success, {files_failed} failed, {files_skipped} skipped',
                 f'📚 Created {folder_chunks} chunks in collection {collection_id}'
@@ -2295,7 +2411,7 @@ def run_single_folder_indexing(folder_id, folder_name):
             message=f'Error indexing {folder_name}: {str(e)}',
             error=str(e),
             completed_at=datetime.now().isoformat(),
-            logs=indexing_status['logs'] + [f'❌ ERROR: {str(e)}']
+            log=f'❌ ERROR: {str(e)}'
         )
 
 def run_full_indexing_process():
@@ -2306,7 +2422,7 @@ def run_full_indexing_process():
     
     # CRITICAL FIX: Wrap entire process in try/finally for crash recovery
     try:
-        from googleapiclient.discovery import build
+        from auth import build_drive_service
         from googleapiclient.errors import HttpError
         from document_loader import GoogleDriveLoader, chunk_text, extract_text
         from vector_store import VectorStore
@@ -2315,7 +2431,6 @@ def run_full_indexing_process():
         from config import USE_VERTEX_EMBEDDINGS, CHUNK_SIZE, CHUNK_OVERLAP
         import pickle
         import os
-        import json
         import re
         import signal
         from functools import wraps
@@ -2403,14 +2518,14 @@ def run_full_indexing_process():
             raise Exception('❌ Google Drive not authenticated. Please connect via admin dashboard first.')
         
         update_status(
-            logs=indexing_status['logs'] + ['✅ Credentials validated']
+            log='✅ Credentials validated'
         )
         
         # Load and validate Google Drive credentials
         update_status(
             progress=5,
             message='🔐 Connecting to Google Drive...',
-            logs=indexing_status['logs'] + ['Loading Google credentials...']
+            log='Loading Google credentials...'
         )
         
         with open(TOKEN_FILE, 'rb') as token:
@@ -2419,26 +2534,26 @@ def run_full_indexing_process():
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
                 update_status(
-                    logs=indexing_status['logs'] + ['⚠️ Token expired, attempting refresh...']
+                    log='⚠️ Token expired, attempting refresh...'
                 )
                 from google.auth.transport.requests import Request
                 creds.refresh(Request())
                 with open(TOKEN_FILE, 'wb') as token:
                     pickle.dump(creds, token)
                 update_status(
-                    logs=indexing_status['logs'] + ['✅ Token refreshed successfully']
+                    log='✅ Token refreshed successfully'
                 )
             else:
                 raise Exception('❌ Google Drive credentials invalid. Please reconnect via admin dashboard.')
         
         # Build Drive service
-        drive_service = build('drive', 'v3', credentials=creds)
+        drive_service = build_drive_service(creds)
         
         # Test Drive API connectivity
         try:
             safe_drive_call(lambda: drive_service.about().get(fields='user').execute())
             update_status(
-                logs=indexing_status['logs'] + ['✅ Connected to Google Drive API']
+                log='✅ Connected to Google Drive API'
             )
         except Exception as e:
             raise Exception(f'❌ Failed to connect to Google Drive API: {str(e)}')
@@ -2447,45 +2562,32 @@ def run_full_indexing_process():
         update_status(
             progress=8,
             message='🤖 Initializing embedding service...',
-            logs=indexing_status['logs'] + ['Configuring embeddings...']
+            log='Configuring embeddings...'
         )
         
         embedder = VertexEmbedder() if USE_VERTEX_EMBEDDINGS else LocalEmbedder()
         embedder_name = "Google Vertex AI (768-dim)" if USE_VERTEX_EMBEDDINGS else "Local (384-dim)"
         
         update_status(
-            logs=indexing_status['logs'] + [f'✅ Using {embedder_name}']
+            log=f'✅ Using {embedder_name}'
         )
         
         # Get ONLY ROOT folders from shared drive (not subfolders)
         update_status(
             progress=10,
             message='📁 Discovering ROOT folders in 7MM Resources...',
-            logs=indexing_status['logs'] + ['Scanning for root-level folders only...']
+            log='Scanning for root-level folders only...'
         )
         
         def get_root_folders_only():
             """Get ONLY the root folders directly under 7MM Resources (not subfolders)
             FIXED: Added error handling with retry logic"""
-            # Query for folders that have 7MM Resources as direct parent
-            query = f"'{SHARED_DRIVE_ID}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            
             update_status(
-                logs=indexing_status['logs'] + ['🎯 Fetching only ROOT folders (no subfolders)...']
+                log='🎯 Fetching only ROOT folders (no subfolders)...'
             )
             
             # CRITICAL FIX: Use safe_drive_call with retry logic
-            response = safe_drive_call(lambda: drive_service.files().list(
-                q=query,
-                driveId=SHARED_DRIVE_ID,
-                corpora='drive',
-                supportsAllDrives=True,
-                includeItemsFromAllDrives=True,
-                fields='files(id, name)',
-                pageSize=100
-            ).execute())
-            
-            root_folders = response.get('files', [])
+            root_folders = list_shared_drive_root_folders(drive_service)
             
             # Add path (which is just the name for root folders)
             for folder in root_folders:
@@ -2498,7 +2600,7 @@ def run_full_indexing_process():
         total_folders = len(folders)
         
         update_status(
-            logs=indexing_status['logs'] + [f'✅ Found {total_folders} folders (including all subfolders)']
+            log=f'✅ Found {total_folders} folders (including all subfolders)'
         )
         
         if total_folders == 0:
@@ -2508,7 +2610,7 @@ def run_full_indexing_process():
         loader = GoogleDriveLoader(drive_service)
         
         update_status(
-            logs=indexing_status['logs'] + [f'✅ Google Drive loader initialized (OCR: {"Document AI" if loader.ocr_service else "disabled"})']
+            log=f'✅ Google Drive loader initialized (OCR: {"Document AI" if loader.ocr_service else "disabled"})'
         )
         
         # Index each ROOT folder (with all files recursively from subfolders)
@@ -2524,7 +2626,7 @@ def run_full_indexing_process():
             update_status(
                 progress=progress,
                 message=f'📂 Indexing {folder_name} ({idx}/{total_folders})...',
-                logs=indexing_status['logs'] + [f'\n[{idx}/{total_folders}] 📂 {folder_name}']
+                log=f'\n[{idx}/{total_folders}] 📂 {folder_name}'
             )
             
             try:
@@ -2533,28 +2635,27 @@ def run_full_indexing_process():
                 vector_store = VectorStore(collection_name=collection_id)
                 
                 update_status(
-                    logs=indexing_status['logs'] + [f'  📊 Collection: {collection_id}']
+                    log=f'  📊 Collection: {collection_id}'
                 )
                 
                 # Get ALL files recursively from this root folder and all subfolders
                 update_status(
-                    logs=indexing_status['logs'] + [f'  🔍 Listing files from root folder ID: {folder_id} (including subfolders)...']
+                    log=f'  🔍 Listing files from root folder ID: {folder_id} (including subfolders)...'
                 )
                 
                 files = get_all_files_recursive_from_folder(folder_id, drive_service, 0)
                 folder_file_count = len(files)
                 
                 update_status(
-                    logs=indexing_status['logs'] + [f'  📄 Found {folder_file_count} files']
+                    log=f'  📄 Found {folder_file_count} files'
                 )
                 
                 if folder_file_count == 0:
                     update_status(
-                        logs=indexing_status['logs'] + [f'  ⚠️ Skipping empty folder']
+                        log=f'  ⚠️ Skipping empty folder'
                     )
                     # CRITICAL FIX: Save checkpoint even for empty folders
-                    with open('indexed_folders.json', 'w') as f:
-                        json.dump(indexed_folders, f, indent=2)
+                    _save_indexed_folders(indexed_folders)
                     continue
                 
                 # CRITICAL FIX: Validate collection_id before creating VectorStore
@@ -2563,7 +2664,7 @@ def run_full_indexing_process():
                 
                 if collection_id != raw_collection_id:
                     update_status(
-                        logs=indexing_status['logs'] + [f'  📝 Sanitized collection: {raw_collection_id} → {collection_id}']
+                        log=f'  📝 Sanitized collection: {raw_collection_id} → {collection_id}'
                     )
                 
                 # Process each file (OPTIMIZED - batch processing, reduced logging)
@@ -2599,7 +2700,7 @@ def run_full_indexing_process():
                             
                             if should_log:
                                 update_status(
-                                    logs=indexing_status['logs'] + [f'  [{file_idx}/{folder_file_count}] Processing: {file_name[:50]}...']
+                                    log=f'  [{file_idx}/{folder_file_count}] Processing: {file_name[:50]}...'
                                 )
                                 last_log_time = current_time
                             
@@ -2608,32 +2709,14 @@ def run_full_indexing_process():
                             # CRITICAL FIX: Wrap all Drive API calls in error handling
                             try:
                                 # Handle different file types using Google APIs
-                                if file_mime == 'application/vnd.google-apps.document':
-                                    # Google Docs - export as plain text
-                                    text = loader.export_google_doc(file_id)
-                                    
-                                elif file_mime == 'application/vnd.google-apps.spreadsheet':
-                                    # Google Sheets - export as CSV
-                                    text = loader.export_google_sheets(file_id)
-                                    
-                                elif file_mime == 'application/vnd.google-apps.presentation':
-                                    # Google Slides - export as text
-                                    text = loader.export_google_slides(file_id)
+                                exporter = loader.workspace_exporters.get(file_mime)
+                                if exporter:
+                                    # Docs/Slides export as plain text, Sheets as CSV
+                                    text = exporter(file_id)
                                 
-                                elif file_mime in [
-                                    'application/vnd.google-apps.folder',
-                                    'application/vnd.google-apps.shortcut',
-                                    'application/vnd.google-apps.form',
-                                    'application/vnd.google-apps.drawing',
-                                    'application/vnd.google-apps.map',
-                                    'application/vnd.google-apps.site'
-                                ]:
-                                    # Skip folders (already filtered), shortcuts, and non-textual Google types
-                                    files_skipped += 1
-                                    continue
-                                    
                                 elif file_mime.startswith('application/vnd.google-apps'):
-                                    # Unknown Google Apps file
+                                    # Folders (already filtered), shortcuts, forms, drawings
+                                    # and other non-textual Google types
                                     files_skipped += 1
                                     continue
                                     
@@ -2656,14 +2739,14 @@ def run_full_indexing_process():
                                     files_failed += 1
                                 if files_failed < 3:  # Only log first few errors
                                     update_status(
-                                        logs=indexing_status['logs'] + [f'      ⚠️ HTTP {http_error.resp.status}: {file_name[:30]}']
+                                        log=f'      ⚠️ HTTP {http_error.resp.status}: {file_name[:30]}'
                                     )
                                 continue
                             except Exception as download_error:
                                 files_failed += 1
                                 if files_failed < 3:
                                     update_status(
-                                        logs=indexing_status['logs'] + [f'      ⚠️ Download error: {str(download_error)[:50]}']
+                                        log=f'      ⚠️ Download error: {str(download_error)[:50]}'
                                     )
                                 continue
                             
@@ -2705,12 +2788,9 @@ def run_full_indexing_process():
                                     def generate_embeddings():
                                         return embedder.embed_documents(batch_chunks)
                                     
+                                    # add_documents converts numpy output to lists itself
                                     batch_embeddings = generate_embeddings()
                                     
-                                    # Convert numpy array to list if needed
-                                    if hasattr(batch_embeddings, 'tolist'):
-                                        batch_embeddings = batch_embeddings.tolist()
-                                    
                                     # Add batch to vector store
                                     vector_store.add_documents(
                                         documents=batch_chunks,
@@ -2723,12 +2803,12 @@ def run_full_indexing_process():
                                     
                                 except TimeoutError:
                                     update_status(
-                                        logs=indexing_status['logs'] + [f'      ⚠️ Embedding timeout, skipping batch of {len(batch_chunks)} chunks']
+                                        log=f'      ⚠️ Embedding timeout, skipping batch of {len(batch_chunks)} chunks'
                                     )
                                     files_failed += 1
                                 except Exception as embedding_error:
                                     update_status(
-                                        logs=indexing_status['logs'] + [f'      ❌ Embedding error: {str(embedding_error)[:100]}']
+                                        log=f'      ❌ Embedding error: {str(embedding_error)[:100]}'
                                     )
                                     files_failed += 1
                                 finally:
@@ -2744,7 +2824,7 @@ def run_full_indexing_process():
                             # Only log errors for important files or periodically
                             if file_idx % 20 == 0 or files_failed < 5:
                                 update_status(
-                                    logs=indexing_status['logs'] + [f'      ❌ Error: {str(file_error)[:100]}']
+                                    log=f'      ❌ Error: {str(file_error)[:100]}'
                                 )
                             continue
                 
@@ -2772,19 +2852,18 @@ def run_full_indexing_process():
                 total_chunks_created += folder_chunks
                 
                 update_status(
-                    logs=indexing_status['logs'] + [f'  ✅ Complete: {files_succeeded} success, {files_failed} failed, {files_skipped} skipped → {folder_chunks} chunks']
+                    log=f'  ✅ Complete: {files_succeeded} success, {files_failed} failed, {files_skipped} skipped → {folder_chunks} chunks'
                 )
                 
                 # CRITICAL FIX: Checkpoint after each folder to prevent data loss
                 try:
-                    with open('indexed_folders.json', 'w') as f:
-                        json.dump(indexed_folders, f, indent=2)
+                    _save_indexed_folders(indexed_folders)
                     update_status(
-                        logs=indexing_status['logs'] + [f'  💾 Checkpoint saved']
+                        log=f'  💾 Checkpoint saved'
                     )
                 except Exception as checkpoint_error:
                     update_status(
-                        logs=indexing_status['logs'] + [f'  ⚠️ Checkpoint error: {str(checkpoint_error)}']
+                        log=f'  ⚠️ Checkpoint error: {str(checkpoint_error)}'
                     )
                 
                 # Memory cleanup
@@ -2793,22 +2872,20 @@ def run_full_indexing_process():
                 
             except Exception as folder_error:
                 update_status(
-                    logs=indexing_status['logs'] + [f'  ❌ Folder failed: {str(folder_error)[:200]}']
+                    log=f'  ❌ Folder failed: {str(folder_error)[:200]}'
                 )
                 # CRITICAL FIX: Save checkpoint even on folder failure
                 try:
-                    with open('indexed_folders.json', 'w') as f:
-                        json.dump(indexed_folders, f, indent=2)
+                    _save_indexed_folders(indexed_folders)
                 except:
                     pass
                 continue
         
         # Save indexed folders info (final save)
-        with open('indexed_folders.json', 'w') as f:
-            json.dump(indexed_folders, f, indent=2)
+        _save_indexed_folders(indexed_folders)
         
         update_status(
-            logs=indexing_status['logs'] + [f'💾 Saved folder metadata to indexed_folders.json']
+            log=f'💾 Saved folder metadata to indexed_folders.json'
         )
         
         # Complete
@@ -2817,7 +2894,7 @@ def run_full_indexing_process():
             progress=100,
             message=f'✅ Indexing complete!',
             completed_at=datetime.now().isoformat(),
-            logs=indexing_status['logs'] + [
+            log=[
                 f'\n{"="*60}',
                 f'🎉 INDEXING COMPLETE',
                 f'{"="*60}',
@@ -2839,7 +2916,7 @@ def run_full_indexing_process():
             message=f'❌ Indexing failed: {str(e)}',
             error=str(e),
             completed_at=datetime.now().isoformat(),
-            logs=indexing_status['logs'] + [
+            log=[
                 f'❌ Fatal error: {str(e)}',
                 f'Stack trace: {traceback.format_exc()[:500]}'
             ]
@@ -3,9 +3,14 @@
 Get Full Folder IDs and Index All Except Market Resources
 """
 
+import argparse
 import os
+import subprocess
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -56,7 +61,55 @@ def get_full_folder_list():
         print(f"❌ Error getting folders: {e}")
         return []
 
+def index_folder(name, folder_id, timeout=300):
+    """Run console_indexer.py for one folder. Returns (name, ok, error_lines)."""
+    # Stream the indexer's stderr instead of buffering all of it; only the
+    # last few non-blank lines are kept for error reporting. stdout is
+    # progress noise nobody reads, so it isn't piped at all.
+    tail = deque(maxlen=3)
+    timed_out = threading.Event()
+    
+    try:
+        proc = subprocess.Popen([
+            sys.executable, "console_indexer.py", 
+            "--index-folder", folder_id
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+    except Exception as e:
+        return name, False, [f"Exception: {e}"]
+    
+    def kill_on_timeout():
+        timed_out.set()
+        proc.kill()
+    
+    timer = threading.Timer(timeout, kill_on_timeout)  # 5 minute timeout per folder
+    timer.start()
+    try:
+        for line in proc.stderr:
+            line = line.rstrip()
+            if line:
+                tail.append(line)
+        returncode = proc.wait()
+    finally:
+        timer.cancel()
+        proc.stderr.close()
+    
+    if timed_out.is_set():
+        return name, False, [f"Timeout after {timeout // 60} minutes"]
+    if returncode == 0:
+        return name, True, []
+    
+    # Keep the last few lines of error output
+    return name, False, list(tail)
+
 def main():
+    parser = argparse.ArgumentParser(description="Index every shared-drive folder except Market Resources")
+    parser.add_argument(
+        '--concurrency', type=int, default=1,
+        help="Folders to index at once (default: 1). Raise with care: every indexer "
+             "writes to the same Chroma directory and shares the Drive/Vertex quotas."
+    )
+    args = parser.parse_args()
+    
     print("🔍 Getting Full Folder List...")
     folders = get_full_folder_list()
     
@@ -105,39 +158,23 @@ def main():
     print(f"\n🚀 Starting indexing process...")
     print("=" * 100)
     
-    for i, (name, folder_id) in enumerate(folders_to_index, 1):
-        print(f"[{i}/{len(folders_to_index)}] 🔄 Indexing: {name}")
-        
-        try:
-            import subprocess
-            result = subprocess.run([
-                sys.executable, "console_indexer.py", 
-                "--index-folder", folder_id
-            ], capture_output=True, text=True, timeout=300, encoding='utf-8', errors='replace')  # 5 minute timeout per folder
-            
-            if result.returncode == 0:
-                print(f"    ✅ Success!")
+    total = len(folders_to_index)
+    concurrency = max(1, min(args.concurrency, total))
+    if concurrency > 1:
+        print(f"⚡ Indexing {concurrency} folders at a time")
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(index_folder, name, folder_id) for name, folder_id in folders_to_index]
+        for i, future in enumerate(as_completed(futures), 1):
+            name, ok, error_lines = future.result()
+            if ok:
+                print(f"[{i}/{total}] ✅ {name}")
                 successful.append(name)
             else:
-                print(f"    ❌ Failed!")
-                if result.stderr:
-                    error_lines = result.stderr.strip().split('\n')
-                    # Show last few lines of error
-                    for line in error_lines[-3:]:
-                        if line.strip():
-                            print(f"    Error: {line}")
+                print(f"[{i}/{total}] ❌ {name}")
+                for line in error_lines:
+                    print(f"    Error: {line}")
                 failed.append(name)
-        
-        except subprocess.TimeoutExpired:
-            print(f"    ⏰ Timeout after 5 minutes")
-            failed.append(name)
-        except Exception as e:
-            print(f"    ❌ Exception: {e}")
-            failed.append(name)
-        
-        # Small delay between folders
-        if i < len(folders_to_index):
-            time.sleep(2)
     
     # Final summary
     print("\n" + "=" * 100)
@@ -151,7 +188,7 @@ def main():
     for name in failed:
         print(f"   • {name}")
     
-    print(f"\n🎉 Process complete! {len(successful)}/{len(folders_to_index)} folders indexed successfully.")
+    print(f"\n🎉 Process complete! {len(successful)}/{total} folders indexed successfully.")
     
     return 0
 
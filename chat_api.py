@@ -9,6 +9,7 @@ import argparse
 import time
 import io
 from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import gzip
 import base64
@@ -30,7 +31,7 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from rag_system import EnhancedRAGSystem, MultiCollectionRAGSystem
-from auth import authenticate_google_drive
+from auth import authenticate_google_drive, build_drive_service
 from oauth_config import require_auth, oauth_config
 from admin_auth import require_admin
 from auth_routes import auth_bp
@@ -527,48 +528,60 @@ def auto_generate_indexed_folders():
     print("[+] indexed_folders.json not found - auto-generating from ChromaDB collections...")
     
     try:
-        import chromadb
+        from vector_store import get_client
         from config import CHROMA_PERSIST_DIR
         from datetime import datetime
         
         # Connect to ChromaDB
-        client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+        client = get_client(CHROMA_PERSIST_DIR)
         collections = client.list_collections()
         
         print(f"[+] Found {len(collections)} collections in ChromaDB")
         
         indexed_folders = {}
         
-        for collection in collections:
-            collection_name = collection.name
-            
-            # Skip non-folder collections
-            if not collection_name.startswith('folder_'):
-                continue
-            
-            # Extract folder_id from collection name
-            folder_id = collection_name.replace('folder_', '')
-            
+        # Skip non-folder collections
+        folder_collections = [c for c in collections if c.name.startswith('folder_')]
+        
+        def probe_collection(collection):
+            """Return (doc_count, folder_name or None, corruption error or None)."""
             # Get collection stats (handle corruption)
             try:
                 doc_count = collection.count()
             except (TypeError, AttributeError) as e:
-                print(f"  ⚠️  Collection {collection_name} appears corrupted - skipping ({e})")
-                continue
-            
+                return 0, None, e
             if doc_count == 0:
-                print(f"  ⚠️  Collection {collection_name} is empty - skipping")
-                continue
+                return doc_count, None, None
             
             # Get sample metadata to extract folder info
             try:
                 results = collection.get(limit=1, include=['metadatas'])
                 if results and results['metadatas'] and len(results['metadatas']) > 0:
                     sample_metadata = results['metadatas'][0]
-                    folder_name = sample_metadata.get('file_path', 'Unknown').split('/')[0] or 'Unknown'
-                else:
-                    folder_name = f"Folder {folder_id}"
-            except Exception as e:
+                    return doc_count, sample_metadata.get('file_path', 'Unknown').split('/')[0] or 'Unknown', None
+            except Exception:
+                pass
+            return doc_count, None, None
+        
+        # Probe collections concurrently; each probe is two Chroma reads
+        with ThreadPoolExecutor(max_workers=8) as probe_executor:
+            probes = list(probe_executor.map(probe_collection, folder_collections))
+        
+        for collection, (doc_count, folder_name, corruption_error) in zip(folder_collections, probes):
+            collection_name = collection.name
+            
+            # Extract folder_id from collection name
+            folder_id = collection_name.replace('folder_', '')
+            
+            if corruption_error is not None:
+                print(f"  ⚠️  Collection {collection_name} appears corrupted - skipping ({corruption_error})")
+                continue
+            
+            if doc_count == 0:
+                print(f"  ⚠️  Collection {collection_name} is empty - skipping")
+                continue
+            
+            if not folder_name:
                 folder_name = f"Folder {folder_id}"
             
             # Create entry
@@ -612,32 +625,22 @@ def initialize_rag_system():
     
     _rag_initialized = True
     
+    # Drive auth is network-bound; start it now so it overlaps with reading
+    # the collection registry below. Non-interactive during server startup.
+    auth_executor = ThreadPoolExecutor(max_workers=1)
+    auth_future = auth_executor.submit(authenticate_google_drive, interactive=False)
+    auth_executor.shutdown(wait=False)
+    
     # Auto-generate indexed_folders.json if it doesn't exist
     auto_generate_indexed_folders()
     
     try:
-        # print("[+] Initializing Google Drive authentication...")  # Disabled for production
-        try:
-            # Use non-interactive mode during server startup
-            drive_service = authenticate_google_drive(interactive=False)
-            if drive_service:
-                # print("✅ Google Drive authentication successful!")  # Disabled for production
-                pass
-            else:
-                # print("⚠️  Google Drive credentials not found - run 'python auth.py' to set up")  # Disabled for production
-                drive_service = None
-        except Exception as drive_error:
-            # print(f"❌ Google Drive authentication failed: {drive_error}")  # Disabled for production
-            # print("    Please run: python auth.py to set up Google Drive credentials")  # Disabled for production
-            # print("    Continuing without Google Drive (folders will be unavailable)")  # Disabled for production
-            drive_service = None
-        
         # Load available collections from indexed_folders.json (if exists)
         indexed_folders_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indexed_folders.json')
         # print(f"Looking for indexed folders at: {indexed_folders_file}")  # Disabled for production
         
         if os.path.exists(indexed_folders_file):
-            with open(indexed_folders_file, 'r') as f:
+            with open(indexed_folders_file, 'r', encoding='utf-8') as f:
                 indexed_folders = json.load(f)
             
             for folder_id, folder_info in indexed_folders.items():
@@ -655,29 +658,47 @@ def initialize_rag_system():
         
         # print(f"[+] Found {len(available_collections)} available collections")  # Disabled for production
         
+        # print("[+] Initializing Google Drive authentication...")  # Disabled for production
+        try:
+            drive_service = auth_future.result()
+            if not drive_service:
+                # print("⚠️  Google Drive credentials not found - run 'python auth.py' to set up")  # Disabled for production
+                drive_service = None
+        except Exception as drive_error:
+            # print(f"❌ Google Drive authentication failed: {drive_error}")  # Disabled for production
+            # print("    Continuing without Google Drive (folders will be unavailable)")  # Disabled for production
+            drive_service = None
+        
         # Initialize RAG systems for the available collections
         if available_collections:
             try:
                 print("[+] Initializing RAG systems...")  # Temporarily enabled for debugging
                 
-                # Initialize individual collection RAG systems
-                for collection_name in available_collections:
-                    if collection_name != "ALL_COLLECTIONS":
-                        try:
-                            print(f"    [+] Initializing RAG for collection: {collection_name}")  # Temporarily enabled
-                            temp_rag = EnhancedRAGSystem(
-                                drive_service=drive_service, 
-                                collection_name=collection_name
-                            )
-                            print(f"    ✓ Initialized RAG for collection: {collection_name}")  # Temporarily enabled
-                            # Use the first available collection as default if rag_system is None
-                            if rag_system is None:
-                                rag_system = temp_rag
-                                print(f"    ✓ Set {collection_name} as default RAG system")  # Temporarily enabled
-                        except Exception as e:
-                            print(f"    ⚠️  Failed to initialize RAG for {collection_name}: {e}")  # Temporarily enabled
-                            import traceback
-                            traceback.print_exc()  # Temporarily enabled
+                # Initialize individual collection RAG systems in parallel;
+                # each build is dominated by Chroma/model client I/O
+                def build_collection_rag(collection_name):
+                    print(f"    [+] Initializing RAG for collection: {collection_name}")  # Temporarily enabled
+                    return EnhancedRAGSystem(
+                        drive_service=drive_service, 
+                        collection_name=collection_name
+                    )
+                
+                init_names = [name for name in available_collections if name != "ALL_COLLECTIONS"]
+                with ThreadPoolExecutor(max_workers=max(1, min(8, len(init_names)))) as init_executor:
+                    init_futures = [init_executor.submit(build_collection_rag, name) for name in init_names]
+                
+                # Walk results in registry order so the default collection is stable
+                for collection_name, future in zip(init_names, init_futures):
+                    try:
+                        temp_rag = future.result()
+                        print(f"    ✓ Initialized RAG for collection: {collection_name}")  # Temporarily enabled
+                        # Use the first available collection as default if rag_system is None
+                        if rag_system is None:
+                            rag_system = temp_rag
+                            print(f"    ✓ Set {collection_name} as default RAG system")  # Temporarily enabled
+                    except Exception as e:
+                        print(f"    ⚠️  Failed to initialize RAG for {collection_name}: {e}")  # Temporarily enabled
+                        traceback.print_exc()  # Temporarily enabled
                 
                 # Initialize multi-collection RAG if multiple collections available
                 collection_names = [k for k in available_collections.keys() if k != "ALL_COLLECTIONS"]
@@ -692,13 +713,11 @@ def initialize_rag_system():
                         print(f"    ✓ Initialized multi-collection RAG for {len(collection_names)} collections")  # Temporarily enabled
                     except Exception as e:
                         print(f"    ⚠️  Failed to initialize multi-collection RAG: {e}")  # Temporarily enabled
-                        import traceback
                         traceback.print_exc()
                         
                 print("✅ RAG system initialization completed")  # Temporarily enabled
             except Exception as e:
                 print(f"❌ Error during RAG initialization: {e}")  # Temporarily enabled
-                import traceback
                 traceback.print_exc()
         
         # Add special "ALL_COLLECTIONS" entry
@@ -1017,12 +1036,12 @@ def switch_collection():
             print(f"[!] ChromaDB error detected: {str(db_error)}")
             print("[!] Attempting to recreate collection...")
             
-            import chromadb
+            from vector_store import get_client
             from config import CHROMA_PERSIST_DIR
             
             # Delete and recreate the corrupted collection
             try:
-                client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+                client = get_client(CHROMA_PERSIST_DIR)
                 client.delete_collection(name=collection)
                 print(f"[+] Deleted corrupted collection: {collection}")
             except Exception as del_err:
@@ -1318,7 +1337,6 @@ def reinitialize_drive():
         # Try to load credentials that were saved during web auth
         import pickle
         import os
-        from googleapiclient.discovery import build
         from google.auth.transport.requests import Request
         
         if os.path.exists(TOKEN_FILE):
@@ -1328,7 +1346,7 @@ def reinitialize_drive():
             
             # Check if credentials are valid or need refresh
             if creds and creds.valid:
-                drive_service = build('drive', 'v3', credentials=creds)
+                drive_service = build_drive_service(creds)
                 print("[Drive Reinit] ✅ Google Drive service initialized from valid credentials!")
                 return jsonify({
                     'success': True,
@@ -1343,7 +1361,7 @@ def reinitialize_drive():
                     # Save the refreshed credentials
                     with open(TOKEN_FILE, 'wb') as token:
                         pickle.dump(creds, token)
-                    drive_service = build('drive', 'v3', credentials=creds)
+                    drive_service = build_drive_service(creds)
                     print("[Drive Reinit] ✅ Token refreshed and Drive service initialized!")
                     return jsonify({
                         'success': True,
@@ -1409,8 +1427,7 @@ def drive_status():
                         print("[Drive Status] Token refreshed successfully")
                         
                         # Reinitialize drive service with refreshed creds
-                        from googleapiclient.discovery import build
-                        drive_service = build('drive', 'v3', credentials=creds)
+                        drive_service = build_drive_service(creds)
                     except Exception as refresh_error:
                         print(f"[Drive Status] Token refresh failed: {refresh_error}")
             except Exception as creds_error:
@@ -1438,7 +1455,7 @@ def drive_status():
                 socket.setdefaulttimeout(10)  # 10 second timeout
                 
                 try:
-                    drive_service.files().list(pageSize=1).execute()
+                    drive_service.files().list(pageSize=1, fields='files(id)').execute()
                 finally:
                     socket.setdefaulttimeout(original_timeout)
                     
@@ -50,19 +50,24 @@ def _collection_name(folder_id: str) -> str:
 
 def _load_indexed_folders() -> dict:
     if os.path.exists('indexed_folders.json'):
-        with open('indexed_folders.json', 'r') as f:
+        with open('indexed_folders.json', 'r', encoding='utf-8') as f:
             return json.load(f)
     return {}
 
 
 def export_folder(folder_id: str, output: str = None) -> int:
     """Export one folder's collection + tracker state to a package file."""
-    from vector_store import VectorStore
+    from vector_store import VectorStore, collection_exists
     from file_tracker import FileTracker
 
     name = _collection_name(folder_id)
     output = output or f"{name}.ragpack.gz"
 
+    # VectorStore() would create a missing collection just to find it empty
+    if not collection_exists(name):
+        print(f"ERROR: collection '{name}' not found — index the folder first")
+        return 1
+
     vs = VectorStore(collection_name=name)
     total = vs.collection.count()
     if total == 0:
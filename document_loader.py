@@ -7,6 +7,7 @@ from googleapiclient.http import MediaIoBaseDownload
 from PyPDF2 import PdfReader
 from docx import Document as DocxDocument
 from pptx import Presentation
+import numpy as np
 import pandas as pd
 from config import (
     CHUNK_SIZE, 
@@ -70,6 +71,12 @@ class GoogleDriveLoader:
         self.service = service
         self.ocr_service = None
         self._initialize_ocr()
+        # Google Workspace mime type -> text exporter; anything else is downloaded
+        self.workspace_exporters = {
+            'application/vnd.google-apps.document': self.export_google_doc,
+            'application/vnd.google-apps.presentation': self.export_google_slides,
+            'application/vnd.google-apps.spreadsheet': self.export_google_sheets,
+        }
     
     def _initialize_ocr(self):
         """Initialize OCR service if enabled"""
@@ -170,8 +177,9 @@ def extract_text_from_pptx(file_content):
             slide_text = [f"[Slide {slide_num}]"]
             
             for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text.strip():
-                    slide_text.append(shape.text.strip())
+                shape_text = shape.text.strip() if hasattr(shape, "text") else ""
+                if shape_text:
+                    slide_text.append(shape_text)
             
             # Only add slide if it has text content
             if len(slide_text) > 1:
@@ -183,6 +191,27 @@ def extract_text_from_pptx(file_content):
         return ""
 
 
+# Elementwise str() / "has non-whitespace text" over object arrays
+_cell_str = np.frompyfunc(str, 1, 1)
+_cell_has_text = np.frompyfunc(lambda cell: bool(cell.strip()), 1, 1)
+
+
+def _rows_as_text(df, skip_blank=False):
+    """
+    Render each DataFrame row as "cell | cell | ...", leaving out missing cells
+    (and whitespace-only ones if skip_blank). The whole table is converted and
+    masked at once rather than building a Series per row with iterrows; rows
+    with no cells left are omitted.
+    """
+    values = df.to_numpy(dtype=object)
+    keep = pd.notna(values)
+    cells = _cell_str(values)
+    if skip_blank:
+        keep &= _cell_has_text(cells).astype(bool)
+    rows = (" | ".join(row[mask]) for row, mask in zip(cells, keep))
+    return [row for row in rows if row]
+
+
 def extract_text_from_xlsx(file_content):
     """Extract text from Excel - returns complete file without chunking marker"""
     try:
@@ -200,10 +229,7 @@ def extract_text_from_xlsx(file_content):
             sheet_text.append(f"Headers: {headers}")
             
             # Index ALL rows
-            for idx, row in df.iterrows():
-                row_text = " | ".join([str(val) for val in row.values if pd.notna(val) and str(val).strip()])
-                if row_text:
-                    sheet_text.append(row_text)
+            sheet_text.extend(_rows_as_text(df, skip_blank=True))
             
             text_parts.append("\n".join(sheet_text))
         
@@ -213,6 +239,19 @@ def extract_text_from_xlsx(file_content):
         return ""
 
 
+# Row/column keyword checks for the CSV summary, one regex pass per cell
+# instead of one substring scan per keyword
+_TOTAL_ROW_PATTERN = re.compile(r'total|sum|grand|---|===|summary')
+_CURRENCY_COLUMN_PATTERN = re.compile(
+    r'revenue|sales|amount|price|total|-20|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec',
+    re.IGNORECASE
+)
+_NUMERIC_TOTAL_COLUMN_PATTERN = re.compile(
+    r'revenue|sales|amount|price|cost|total|value|-20|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|\$',
+    re.IGNORECASE
+)
+
+
 def extract_text_from_csv(file_content):
     """
     Extract text from CSV - NEW APPROACH: Store complete CSV data as single unit
@@ -253,7 +292,7 @@ def extract_text_from_csv(file_content):
         for idx, row in last_rows.iterrows():
             # Check if this row contains total indicators
             first_col_value = str(row.iloc[0]).lower() if len(row) > 0 else ""
-            if any(indicator in first_col_value for indicator in ['total', 'sum', 'grand', 'report total', '---', '===', 'summary']):
+            if _TOTAL_ROW_PATTERN.search(first_col_value):
                 totals_found = True
                 # Format this row nicely
                 row_parts = []
@@ -265,7 +304,7 @@ def extract_text_from_csv(file_content):
                             if num_val != 0:
                                 col_str = str(col_name)
                                 # Check if column looks like a month or currency column
-                                if any(keyword in col_str.lower() for keyword in ['revenue', 'sales', 'amount', 'price', 'total', '-20', 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']):
+                                if _CURRENCY_COLUMN_PATTERN.search(col_str):
                                     row_parts.append(f"  {col_name}: ${num_val:,.2f}")
                                 else:
                                     row_parts.append(f"  {col_name}: {value}")
@@ -287,7 +326,7 @@ def extract_text_from_csv(file_content):
                         total = numeric_col.sum()
                         if total != 0:
                             col_str = str(col)
-                            if any(keyword in col_str.lower() for keyword in ['revenue', 'sales', 'amount', 'price', 'cost', 'total', 'value', '-20', 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']) or '$' in col_str:
+                            if _NUMERIC_TOTAL_COLUMN_PATTERN.search(col_str):
                                 summary_parts.append(f"  {col}: ${total:,.2f}")
                 except:
                     pass
@@ -297,10 +336,7 @@ def extract_text_from_csv(file_content):
         # Add ALL the data (not chunked)
         # Format each row for readability
         summary_parts.append("\nCOMPLETE DATA:\n")
-        for idx, row in df.iterrows():
-            row_text = " | ".join([str(val) for val in row.values if pd.notna(val)])
-            if row_text:
-                summary_parts.append(row_text)
+        summary_parts.extend(_rows_as_text(df))
         
         # Add summary footer
         summary_parts.append(f"\n-------Report Total------- (All {total_rows} rows included above)")
@@ -578,13 +614,13 @@ def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, return_parent
     Returns:
         List of text chunks, or tuple of (child_chunks, parent_chunks) if return_parents=True
     """
-    if not text or len(text.strip()) == 0:
+    if not text or text.isspace():
         return [] if not return_parents else ([], [])
     
     # Check if this is a CSV with pre-defined chunk boundaries
     if "--- CSV CHUNK BOUNDARY ---" in text:
         # Split on boundaries and return as-is
-        chunks = [chunk.strip() for chunk in text.split("--- CSV CHUNK BOUNDARY ---") if chunk.strip()]
+        chunks = [chunk for chunk in (part.strip() for part in text.split("--- CSV CHUNK BOUNDARY ---")) if chunk]
         if return_parents and USE_PARENT_DOCUMENT_RETRIEVAL:
             return (chunks, chunks)  # Parent and child are the same for CSVs
         return chunks
@@ -30,12 +30,31 @@ class EmbeddingCache:
         """Generate cache key from text"""
         return f"emb_{hashlib.md5(text.encode('utf-8')).hexdigest()}"
     
-    def get(self, text):
+    def _decode(self, result, normalize=False):
+        """Turn a stored entry into a float32 vector, normalizing it if asked and not already."""
+        # Entries written before the normalized flag are bare lists
+        if isinstance(result, dict):
+            embedding, normalized = result['embedding'], result.get('normalized', False)
+        else:
+            embedding, normalized = result, False
+        if isinstance(embedding, bytes):
+            embedding = np.frombuffer(embedding, dtype=np.float32)
+        else:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        if normalize and not normalized:
+            norm = np.linalg.norm(embedding)
+            return embedding / norm if norm > 0 else embedding
+        return embedding
+    
+    def get(self, text, normalize=False):
         """
         Get embedding from cache.
         
         Args:
             text: Document text
+            normalize: If True, return a unit vector. Entries stored with
+                normalized=True are returned as-is; older entries are
+                normalized on read.
             
         Returns:
             numpy array of embedding, or None if not cached
@@ -45,47 +64,84 @@ class EmbeddingCache:
         
         if result is not None:
             self.hits += 1
-            return np.array(result)
+            return self._decode(result, normalize)
         else:
             self.misses += 1
             return None
     
-    def set(self, text, embedding):
+    def set(self, text, embedding, normalized=False):
         """
         Store embedding in cache.
         
         Args:
             text: Document text
             embedding: Embedding vector (numpy array or list)
+            normalized: Whether the vector is already L2-normalized
         """
         key = self._get_key(text)
-        # Handle both numpy arrays and lists
-        if hasattr(embedding, 'tolist'):
-            embedding = embedding.tolist()
-        self.cache.set(key, embedding, expire=self.ttl_seconds)
+        # Stored as packed float32 bytes: far cheaper to pickle and load than
+        # a list of Python floats, and rows can be joined straight into a matrix
+        embedding = np.asarray(embedding, dtype=np.float32).tobytes()
+        self.cache.set(key, {'embedding': embedding, 'normalized': normalized}, expire=self.ttl_seconds)
     
-    def get_batch(self, texts):
+    def get_batch(self, texts, normalize=False):
         """
         Get multiple embeddings from cache.
         
         Args:
             texts: List of document texts
+            normalize: If True, return unit vectors (see get)
             
         Returns:
             List of embeddings (None for cache misses)
         """
-        return [self.get(text) for text in texts]
+        return [self.get(text, normalize=normalize) for text in texts]
     
-    def set_batch(self, texts, embeddings):
+    def get_matrix(self, texts, normalize=False):
+        """
+        Get the cached embeddings for texts as one contiguous matrix.
+        
+        Args:
+            texts: List of document texts
+            normalize: If True, return unit vectors (see get)
+            
+        Returns:
+            (indices of the texts that were cached, float32 matrix with one
+            row per index, in the same order)
+        """
+        hit_indices = []
+        entries = []
+        for i, text in enumerate(texts):
+            result = self.cache.get(self._get_key(text))
+            if result is not None:
+                hit_indices.append(i)
+                entries.append(result)
+        
+        self.hits += len(hit_indices)
+        self.misses += len(texts) - len(hit_indices)
+        
+        if not entries:
+            return hit_indices, np.empty((0, 0), dtype=np.float32)
+        
+        # Packed entries that need no normalization are joined and viewed
+        # as a matrix in one step; older entries are decoded row by row
+        if all(isinstance(entry, dict) and isinstance(entry['embedding'], bytes)
+               and (entry['normalized'] or not normalize) for entry in entries):
+            matrix = np.frombuffer(b''.join(entry['embedding'] for entry in entries), dtype=np.float32)
+            return hit_indices, matrix.reshape(len(entries), -1)
+        return hit_indices, np.vstack([self._decode(entry, normalize) for entry in entries])
+    
+    def set_batch(self, texts, embeddings, normalized=False):
         """
         Store multiple embeddings in cache.
         
         Args:
             texts: List of document texts
             embeddings: List of embedding vectors
+            normalized: Whether the vectors are already L2-normalized
         """
         for text, emb in zip(texts, embeddings):
-            self.set(text, emb)
+            self.set(text, emb, normalized=normalized)
     
     def clear(self):
         """Clear all cached embeddings"""
@@ -137,4 +193,7 @@ if __name__ == "__main__":
     retrieved_batch = cache.get_batch(texts)
     
     print(f"\nBatch test: {len([x for x in retrieved_batch if x is not None])}/10 retrieved")
+    
+    hit_indices, matrix = cache.get_matrix(texts)
+    print(f"Matrix test: {len(hit_indices)}/10 hits, matrix shape {matrix.shape}")
     print(f"Final stats: {cache.get_stats()}")
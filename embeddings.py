@@ -1,6 +1,9 @@
 # embeddings.py - Text embedding generation with hybrid search support
 
-from sentence_transformers import SentenceTransformer, CrossEncoder
+# sentence_transformers (and torch with it) is imported when a model is
+# constructed, so importing this module - e.g. for HybridSearcher, or via
+# rag_system in a Vertex deployment - stays cheap
+import re
 import numpy as np
 from config import (
     EMBEDDING_MODEL, RERANKER_MODEL, USE_HYBRID_SEARCH,
@@ -10,12 +13,16 @@ from config import (
 from rank_bm25 import BM25Okapi
 from typing import List, Dict, Tuple
 
+# Sentence boundaries for compress_context
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r'[.!?]+')
+
 
 class LocalEmbedder:
     """Generate embeddings using local models - completely free"""
     
     def __init__(self, model_name=EMBEDDING_MODEL):
         print(f"Loading embedding model: {model_name}")
+        from sentence_transformers import SentenceTransformer
         self.model = SentenceTransformer(model_name)
         print(f"  Model loaded! Embedding dimension: {self.model.get_sentence_embedding_dimension()}")
         
@@ -107,10 +114,11 @@ class LocalReranker:
     """
     def __init__(self, model_name=RERANKER_MODEL):
         print(f"Loading re-ranking model: {model_name}")
+        from sentence_transformers import CrossEncoder
         self.model = CrossEncoder(model_name)
         print("  Re-ranker loaded!")
 
-    def rerank(self, query: str, contexts: List[str], return_scores: bool = True) -> List[Dict]:
+    def rerank(self, query: str, contexts: List[str], return_scores: bool = True, top_k: int = None) -> List[Dict]:
         """
         Reranks a list of context strings based on a query with batch processing.
         
@@ -118,6 +126,7 @@ class LocalReranker:
             query: Search query
             contexts: List of text chunks to rerank
             return_scores: If True, include scores in results
+            top_k: If set, return only the top_k best contexts
         
         Returns:
             List of dictionaries with score and context, sorted by relevance
@@ -144,7 +153,7 @@ class LocalReranker:
         # Sort by score in descending order
         reranked_results.sort(key=lambda x: x['score'], reverse=True)
         
-        return reranked_results
+        return reranked_results if top_k is None else reranked_results[:top_k]
     
     def compress_context(self, query: str, context: str, threshold: float = 0.3) -> str:
         """
@@ -160,8 +169,7 @@ class LocalReranker:
             Compressed context with only relevant sentences
         """
         # Split into sentences
-        sentences = context.replace('!', '.').replace('?', '.').split('.')
-        sentences = [s.strip() for s in sentences if len(s.strip()) > 10]
+        sentences = [s for s in map(str.strip, _SENTENCE_BOUNDARY_PATTERN.split(context)) if len(s) > 10]
         
         if not sentences:
             return context
@@ -170,11 +178,9 @@ class LocalReranker:
         pairs = [[query, sent] for sent in sentences]
         scores = self.model.predict(pairs)
         
-        # Keep sentences above threshold
-        relevant_sentences = [
-            sent for sent, score in zip(sentences, scores) 
-            if score > threshold
-        ]
+        # Keep sentences above threshold (mask in numpy, then pick only the kept ones)
+        kept = np.flatnonzero(np.asarray(scores) > threshold).tolist()
+        relevant_sentences = [sentences[i] for i in kept]
         
         # Return compressed context, or full context if nothing passed
         return '. '.join(relevant_sentences) + '.' if relevant_sentences else context
@@ -70,6 +70,12 @@ class FileTracker:
                 )
             """)
             
+            # Drive md5Checksum of the source bytes (binary files only); older
+            # databases predate the column, so add it in place
+            cursor.execute("PRAGMA table_info(tracked_files)")
+            if 'source_checksum' not in {row['name'] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE tracked_files ADD COLUMN source_checksum TEXT")
+            
             # Index for folder queries
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_folder_id 
@@ -106,6 +112,15 @@ class FileTracker:
                 )
             """)
             
+            # Small key/value store for sync bookkeeping (e.g. the Drive
+            # changes page token)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            
             logger.info("Database tables initialized")
     
     def get_file_state(self, file_id: str) -> Optional[Dict]:
@@ -159,7 +174,8 @@ class FileTracker:
         modified_time: str,
         chunk_count: int,
         content_hash: Optional[str] = None,
-        file_size: Optional[int] = None
+        file_size: Optional[int] = None,
+        source_checksum: Optional[str] = None
     ):
         """Update or insert file tracking state after successful indexing."""
         now = datetime.utcnow().isoformat()
@@ -170,8 +186,8 @@ class FileTracker:
                 INSERT INTO tracked_files 
                 (file_id, file_name, mime_type, folder_id, folder_name, 
                  modified_time, content_hash, file_size, chunk_count, 
-                 indexed_at, last_checked, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'indexed')
+                 indexed_at, last_checked, status, source_checksum)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'indexed', ?)
                 ON CONFLICT(file_id) DO UPDATE SET
                     file_name = excluded.file_name,
                     mime_type = excluded.mime_type,
@@ -183,11 +199,12 @@ class FileTracker:
                     chunk_count = excluded.chunk_count,
                     indexed_at = excluded.indexed_at,
                     last_checked = excluded.last_checked,
-                    status = 'indexed'
+                    status = 'indexed',
+                    source_checksum = excluded.source_checksum
             """, (
                 file_id, file_name, mime_type, folder_id, folder_name,
                 modified_time, content_hash, file_size, chunk_count,
-                now, now
+                now, now, source_checksum
             ))
     
     def mark_file_checked(self, file_id: str):
@@ -220,12 +237,18 @@ class FileTracker:
             """, (new_name, folder_id))
 
     def remove_file(self, file_id: str):
-        """Completely remove a file from tracking."""
+        """
+        Completely remove a file from tracking. Also drops the stored Drive
+        changes token so the next sync scans every folder and re-indexes it.
+        """
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 DELETE FROM tracked_files WHERE file_id = ?
             """, (file_id,))
+            cursor.execute("""
+                DELETE FROM sync_state WHERE key = 'drive_changes_token'
+            """)
     
     def get_stale_files(self, cutoff_time: datetime) -> List[Dict]:
         """
@@ -399,6 +422,24 @@ class FileTracker:
                 LIMIT ?
             """, (limit,))
             return [dict(row) for row in cursor.fetchall()]
+    
+    def get_sync_state(self, key: str) -> Optional[str]:
+        """Get a stored sync bookkeeping value, or None if unset."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT value FROM sync_state WHERE key = ?
+            """, (key,))
+            row = cursor.fetchone()
+            return row['value'] if row else None
+    
+    def set_sync_state(self, key: str, value: str):
+        """Store a sync bookkeeping value."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)
+            """, (key, value))
 
 
 def compute_content_hash(text: str) -> str:
@@ -1,13 +1,61 @@
 # folder_indexer.py - Root-level folders only
 
-from auth import authenticate_google_drive
+from auth import authenticate_google_drive, build_drive_service
 from document_loader import GoogleDriveLoader, extract_text, chunk_text
 from vector_store import VectorStore
 from config import CHUNK_SIZE, CHUNK_OVERLAP, USE_VERTEX_EMBEDDINGS
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 import os
+import queue
+import threading
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Concurrent Drive downloads during indexing (network-bound, not CPU-bound)
+DOWNLOAD_WORKERS = 16
+# Chunks handed to the embed/store thread at a time while downloads continue
+PIPELINE_BATCH_CHUNKS = 512
+# Vertex embedding calls are remote and latency-bound, so several batches can be
+# in flight at once; a local model already saturates the CPU/GPU with one
+EMBED_WORKERS = 4 if USE_VERTEX_EMBEDDINGS else 1
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# File types the indexer can extract text from
+SUPPORTED_MIME_TYPES = frozenset({
+    'application/pdf',
+    'application/vnd.google-apps.document',
+    'application/vnd.google-apps.presentation',
+    'application/vnd.google-apps.spreadsheet',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'text/csv',
+    'text/plain'
+})
+
+_thread_state = threading.local()
+
+
+def _get_thread_loader(drive_service):
+    """
+    Return a GoogleDriveLoader owned by the calling thread.
+    The underlying httplib2 connection isn't thread-safe, so each download
+    worker builds its own Drive client from the shared service's credentials.
+    """
+    loader = getattr(_thread_state, 'loader', None)
+    if loader is None:
+        service = build_drive_service(drive_service._http.credentials, cache_discovery=False)
+        loader = _thread_state.loader = GoogleDriveLoader(service)
+    return loader
+
 
 class FolderIndexer:
     """Index specific ROOT-LEVEL folders only"""
@@ -18,26 +66,44 @@ class FolderIndexer:
     
     def load_indexed_folders(self):
         if os.path.exists(self.indexed_folders_file):
-            with open(self.indexed_folders_file, 'r') as f:
-                self.indexed_folders = json.load(f)
+            with open(self.indexed_folders_file, 'rb') as f:
+                raw = f.read()
+            self.indexed_folders = orjson.loads(raw) if orjson else json.loads(raw)
         else:
             self.indexed_folders = {}
     
     def save_indexed_folders(self):
-        with open(self.indexed_folders_file, 'w') as f:
-            json.dump(self.indexed_folders, f, indent=2)
+        # Write to a temp file and swap it in so a crash can't truncate the registry
+        if orjson:
+            payload = orjson.dumps(self.indexed_folders, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        else:
+            payload = json.dumps(self.indexed_folders, indent=2, ensure_ascii=False).encode('utf-8')
+        tmp_path = f"{self.indexed_folders_file}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.indexed_folders_file)
     
     def list_shared_drives(self, drive_service):
         """Get all Shared Drives user has access to"""
         print("\n📁 Fetching Shared Drives...")
         
         try:
-            response = drive_service.drives().list(
-                pageSize=100,
-                fields='drives(id, name)'
-            ).execute()
+            shared_drives = []
+            page_token = None
+            
+            while True:
+                response = drive_service.drives().list(
+                    pageSize=100,
+                    fields='nextPageToken, drives(id, name)',
+                    pageToken=page_token
+                ).execute()
+                
+                shared_drives.extend(response.get('drives', []))
+                
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
             
-            shared_drives = response.get('drives', [])
             print(f"✓ Found {len(shared_drives)} Shared Drives\n")
             return shared_drives
         except Exception as e:
@@ -290,17 +356,13 @@ class FolderIndexer:
         return selected_folders
     
     def get_files_recursively(self, drive_service, folder_id, shared_drive_id=None):
-        """Get all files in folder AND all subfolders recursively"""
+        """Get all files in folder AND all subfolders (breadth-first, no recursion)"""
         all_files = []
         
-        # Build query parameters
-        query = f"'{folder_id}' in parents and trashed=false"
-        
         params = {
-            'q': query,
             'spaces': 'drive',
             # OPTIMIZATION: Get modifiedTime for delta indexing
-            'fields': 'files(id, name, mimeType, size, modifiedTime)',
+            'fields': 'nextPageToken, files(id, name, mimeType, size, modifiedTime)',
             'pageSize': 1000,
             'supportsAllDrives': True,
             'includeItemsFromAllDrives': True
@@ -310,37 +372,37 @@ class FolderIndexer:
             params['driveId'] = shared_drive_id
             params['corpora'] = 'drive'
         
-        page_token = None
+        # Folders still to list - a deque keeps deep trees off the call stack
+        pending_folders = deque([folder_id])
         
-        while True:
-            try:
-                params['pageToken'] = page_token
-                response = drive_service.files().list(**params).execute()
-                
-                items = response.get('files', [])
-                
-                for item in items:
-                    mime_type = item.get('mimeType', '')
+        while pending_folders:
+            params['q'] = f"'{pending_folders.popleft()}' in parents and trashed=false"
+            page_token = None
+            
+            while True:
+                try:
+                    params['pageToken'] = page_token
+                    response = drive_service.files().list(**params).execute()
                     
-                    # If it's a folder, recursively get its contents
-                    if mime_type == 'application/vnd.google-apps.folder':
-                        subfolder_files = self.get_files_recursively(
-                            drive_service, 
-                            item['id'], 
-                            shared_drive_id
-                        )
-                        all_files.extend(subfolder_files)
-                    else:
-                        # It's a file, add it
-                        all_files.append(item)
-                
-                page_token = response.get('nextPageToken', None)
-                if page_token is None:
-                    break
+                    items = response.get('files', [])
                     
-            except Exception as e:
-                print(f"    Error scanning subfolder: {e}")
-                break
+                    for item in items:
+                        mime_type = item.get('mimeType', '')
+                        
+                        # If it's a folder, queue it to be listed
+                        if mime_type == FOLDER_MIME_TYPE:
+                            pending_folders.append(item['id'])
+                        else:
+                            # It's a file, add it
+                            all_files.append(item)
+                    
+                    page_token = response.get('nextPageToken', None)
+                    if page_token is None:
+                        break
+                        
+                except Exception as e:
+                    print(f"    Error scanning subfolder: {e}")
+                    break
         
         return all_files
     
@@ -367,25 +429,39 @@ class FolderIndexer:
             all_files.extend(folder_files)
         
         # Filter supported types
-        supported = [
-            'application/pdf',
-            'application/vnd.google-apps.document',
-            'application/vnd.google-apps.presentation',
-            'application/vnd.google-apps.spreadsheet',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'text/csv',
-            'text/plain'
-        ]
-        
-        filtered = [f for f in all_files if f.get('mimeType') in supported]
+        filtered = [f for f in all_files if f.get('mimeType') in SUPPORTED_MIME_TYPES]
         
         print(f"\n✓ Total files found: {len(all_files)}")
         print(f"✓ Indexable files: {len(filtered)}")
         
         return filtered
     
+    def _extract_file_chunks(self, drive_service, file):
+        """
+        Download/export one file and chunk it (runs on a download worker).
+        Returns (status, chunks, text_length) with status 'ok', 'empty' or 'failed'.
+        """
+        loader = _get_thread_loader(drive_service)
+        mime_type = file['mimeType']
+        
+        exporter = loader.workspace_exporters.get(mime_type)
+        if exporter:
+            text = exporter(file['id'])
+        else:
+            content = loader.download_file(file['id'])
+            if content is None:
+                return 'failed', None, 0
+            text = extract_text(content, mime_type)
+        
+        if not text or len(text.strip()) < 50:
+            return 'empty', None, 0
+        
+        chunks = chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+        if not chunks:
+            return 'empty', None, len(text)
+        
+        return 'ok', chunks, len(text)
+    
     def index_folders(self, folder_selections, drive_service):
         """Index selected folders"""
         
@@ -418,7 +494,6 @@ class FolderIndexer:
         
         # Initialize
         print("\n📦 Initializing...")
-        loader = GoogleDriveLoader(drive_service)
         if USE_VERTEX_EMBEDDINGS:
             from vertex_embeddings import VertexEmbedder
             embedder = VertexEmbedder()
@@ -441,121 +516,181 @@ class FolderIndexer:
         all_chunks = []
         all_metadatas = []
         all_ids = []
-        
-        for idx, file in enumerate(files, 1):
-            if idx % 25 == 0:
-                elapsed = time.time() - start_time
-                rate = idx / elapsed
-                remaining = (len(files) - idx) / rate
-                print(f"\n⏱️  Progress: {idx}/{len(files)} ({idx/len(files)*100:.1f}%) - ETA: {remaining/60:.0f} mins")
-            
-            print(f"\n[{idx}/{len(files)}] {file['name'][:60]}")
-            
+        all_stale_ids = []  # modified files in this batch whose old chunks go first
+        
+        # --- OPTIMIZATION: Delta Indexing ---
+        # The up-to-date check is a local Chroma lookup, so it stays on this
+        # thread; only new or modified files are handed to the download pool.
+        # It is read-only: a modified file keeps its old chunks until its new
+        # ones are stored, so an interrupted run leaves the index searchable.
+        pending_files = []
+        stale_file_ids = set()
+        for file in files:
             try:
-                # --- OPTIMIZATION: Delta Indexing ---
-                # Check if this file is already indexed and up-to-date
-                try:
-                    existing_doc = vector_store.collection.get(
-                        where={"file_id": file['id']},
-                        limit=1,
-                        include=["metadatas"]
-                    )
-                    
-                    if existing_doc['metadatas']:
-                        indexed_time = existing_doc['metadatas'][0].get('modified_time')
-                        if indexed_time and indexed_time == file.get('modifiedTime'):
-                            print(f"  ✓ Skipping (up-to-date)")
-                            skipped += 1
-                            continue # Skip to the next file
-                    
-                    # File is new or modified, clear old chunks before adding new
-                    if existing_doc['ids']:
-                        print("  File modified. Clearing old chunks...")
-                        vector_store.collection.delete(where={"file_id": file['id']})
+                existing_doc = vector_store.collection.get(
+                    where={"file_id": file['id']},
+                    limit=1,
+                    include=["metadatas"]
+                )
+                
+                if existing_doc['metadatas']:
+                    indexed_time = existing_doc['metadatas'][0].get('modified_time')
+                    if indexed_time and indexed_time == file.get('modifiedTime'):
+                        skipped += 1
+                        continue # Skip to the next file
+                
+                # File is new or modified; old chunks are replaced once the new ones are ready
+                if existing_doc['ids']:
+                    print(f"  {file['name'][:60]}: modified, will replace old chunks")
+                    stale_file_ids.add(file['id'])
 
+            except Exception as e:
+                print(f"  Warning: Could not check existing doc {file['name'][:60]}: {e}")
+            pending_files.append(file)
+        # --- End Delta Indexing Check ---
+        
+        print(f"✓ Skipping {skipped} up-to-date files")
+        print(f"⬇️  Downloading {len(pending_files)} new/modified files ({DOWNLOAD_WORKERS} at a time)...")
+        
+        # OPTIMIZATION: Pipeline - writer threads embed and store finished
+        # batches while the download pool keeps the network busy.
+        batch_queue = queue.Queue(maxsize=4)
+        write_errors = []
+        chunks_written = 0
+        written_lock = threading.Lock()
+        
+        def write_batches():
+            nonlocal chunks_written
+            while True:
+                batch = batch_queue.get()
+                if batch is None:
+                    return
+                batch_chunks, batch_metadatas, batch_ids, batch_stale_ids = batch
+                try:
+                    batch_embeddings = embedder.embed_documents(batch_chunks)
+                    # Old chunks of modified files go only now that the new ones
+                    # are embedded (a shorter file would otherwise keep its tail)
+                    if batch_stale_ids:
+                        vector_store.collection.delete(where={"file_id": {"$in": batch_stale_ids}})
+                    vector_store.add_documents(batch_chunks, batch_embeddings, batch_metadatas, batch_ids)
+                    with written_lock:
+                        chunks_written += len(batch_chunks)
                 except Exception as e:
-                    print(f"  Warning: Could not check existing doc: {e}")
-                # --- End Delta Indexing Check ---
-
-                mime_type = file['mimeType']
+                    write_errors.append(e)
+                    print(f"\n✗ Error storing batch of {len(batch_chunks)} chunks: {e}")
+        
+        writers = [
+            threading.Thread(target=write_batches, name=f"index-writer-{n}", daemon=True)
+            for n in range(EMBED_WORKERS)
+        ]
+        for writer in writers:
+            writer.start()
+        
+        # OPTIMIZATION: Downloads are network-bound, so run them concurrently and
+        # collect the chunks here as each one finishes.
+        executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+        futures = {
+            executor.submit(self._extract_file_chunks, drive_service, file): file
+            for file in pending_files
+        }
+        
+        try:
+            for idx, future in enumerate(as_completed(futures), 1):
+                file = futures[future]
                 
-                if mime_type == 'application/vnd.google-apps.document':
-                    text = loader.export_google_doc(file['id'])
-                elif mime_type == 'application/vnd.google-apps.presentation':
-                    text = loader.export_google_slides(file['id'])
-                elif mime_type == 'application/vnd.google-apps.spreadsheet':
-                    text = loader.export_google_sheets(file['id'])
-                else:
-                    content = loader.download_file(file['id'])
-                    if content is None:
-                        failed += 1
-                        continue
-                    text = extract_text(content, mime_type)
+                # Fail fast: once embedding/storage breaks (auth, quota, dimension
+                # mismatch) every later batch would fail too, so stop downloading
+                if write_errors:
+                    print(f"\n✗ Embedding failed, stopping after {idx - 1}/{len(pending_files)} files: {write_errors[0]}")
+                    break
                 
-                if not text or len(text.strip()) < 50:
-                    print("  ⚠️  Empty")
-                    empty += 1
-                    continue
+                if idx % 25 == 0:
+                    elapsed = time.time() - start_time
+                    rate = idx / elapsed
+                    remaining = (len(pending_files) - idx) / rate
+                    print(f"\n⏱️  Progress: {idx}/{len(pending_files)} ({idx/len(pending_files)*100:.1f}%) - ETA: {remaining/60:.0f} mins")
                 
-                print(f"  ✓ {len(text):,} chars")
+                print(f"\n[{idx}/{len(pending_files)}] {file['name'][:60]}")
                 
-                chunks = chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+                try:
+                    status, chunks, text_length = future.result()
+                except Exception as e:
+                    print(f"  ✗ Error: {e}")
+                    failed += 1
+                    continue
                 
-                if not chunks:
+                if status == 'failed':
+                    failed += 1
+                    continue
+                if status == 'empty':
+                    print("  ⚠️  Empty")
                     empty += 1
+                    if file['id'] in stale_file_ids:
+                        # The new version has no text, so the old chunks are stale
+                        vector_store.collection.delete(where={"file_id": file['id']})
                     continue
                 
-                # Embeddings are done in one batch later
+                print(f"  ✓ {text_length:,} chars")
+                
+                # Embeddings are generated by the writer threads
+                
+                # Per-file values are looked up once, not once per chunk
+                file_id = file['id']
+                file_name = file['name']
+                mime_type = file['mimeType']
+                modified_time = file.get('modifiedTime') # For delta indexing
+                total_chunks = len(chunks)
                 
                 metadatas = [
                     {
-                        'file_id': file['id'],
-                        'file_name': file['name'],
+                        'file_id': file_id,
+                        'file_name': file_name,
                         'mime_type': mime_type,
                         'chunk_index': i,
-                        'total_chunks': len(chunks),
-                        'modified_time': file.get('modifiedTime') # For delta indexing
+                        'total_chunks': total_chunks,
+                        'modified_time': modified_time
                     }
-                    for i in range(len(chunks))
+                    for i in range(total_chunks)
                 ]
                 
-                ids = [f"{file['id']}_chunk_{i}" for i in range(len(chunks))]
+                ids = [f"{file_id}_chunk_{i}" for i in range(total_chunks)]
                 
                 # Add to batch lists
                 all_chunks.extend(chunks)
                 all_metadatas.extend(metadatas)
                 all_ids.extend(ids)
+                if file_id in stale_file_ids:
+                    all_stale_ids.append(file_id)
                 
                 successful += 1
                 print(f"  ✅ {len(chunks)} chunks (queued)")
                 
-                # OPTIMIZATION: Removed time.sleep(0.3)
+                if len(all_chunks) >= PIPELINE_BATCH_CHUNKS:
+                    batch_queue.put((all_chunks, all_metadatas, all_ids, all_stale_ids))
+                    all_chunks, all_metadatas, all_ids, all_stale_ids = [], [], [], []
                 
-            except KeyboardInterrupt:
-                print(f"\n\n⚠️  Interrupted!")
-                break
-            except Exception as e:
-                print(f"  ✗ Error: {e}")
-                failed += 1
+        except KeyboardInterrupt:
+            print(f"\n\n⚠️  Interrupted!")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
         
         # --- OPTIMIZATION: Process Batches ---
-        if all_chunks:
-            print("\n" + "=" * 80)
-            print(f"🚀 Processing {successful} files...")
-            print(f"  Generating embeddings for {len(all_chunks)} total chunks...")
-            
-            try:
-                all_embeddings = embedder.embed_documents(all_chunks)
-                
-                print(f"  Adding {len(all_chunks)} chunks to vector store...")
-                vector_store.add_documents(all_chunks, all_embeddings, all_metadatas, all_ids)
-                
-                print("✓ Batch add complete!")
-                
-            except Exception as e:
-                print(f"\n✗ Error during batch processing: {e}")
-                print("  Some documents may not have been indexed.")
-
+        # Hand over the last partial batch and wait for the writers to drain
+        if all_chunks and not write_errors:
+            batch_queue.put((all_chunks, all_metadatas, all_ids, all_stale_ids))
+        for _ in writers:
+            batch_queue.put(None)
+        
+        print("\n" + "=" * 80)
+        print(f"🚀 Finishing embeddings for {successful} files...")
+        for writer in writers:
+            writer.join()
+        print(f"✓ Stored {chunks_written} chunks")
+        if write_errors:
+            print(f"  {len(write_errors)} batch(es) failed - indexing aborted: {write_errors[0]}")
+            print("  Folders were not marked as indexed. Files not stored in this run keep their")
+            print("  previous chunks (if any); re-run to pick up the remaining files.")
+            return
         
         # Mark as indexed
         for folder_selection in folder_selections:
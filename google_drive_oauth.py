@@ -6,7 +6,7 @@ Web-based OAuth flow that works through the browser
 from flask import Blueprint, request, redirect, url_for, session, jsonify
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from auth import build_drive_service
 import os
 import pickle
 import json
@@ -112,8 +112,8 @@ def auth_status():
                 socket.setdefaulttimeout(10)  # 10 second timeout
                 
                 try:
-                    service = build('drive', 'v3', credentials=creds)
-                    service.files().list(pageSize=1).execute()
+                    service = build_drive_service(creds)
+                    service.files().list(pageSize=1, fields='files(id)').execute()
                 finally:
                     socket.setdefaulttimeout(original_timeout)
                 
@@ -219,8 +219,8 @@ def oauth_callback():
         
         # Test the connection
         try:
-            service = build('drive', 'v3', credentials=credentials)
-            result = service.files().list(pageSize=5).execute()
+            service = build_drive_service(credentials)
+            result = service.files().list(pageSize=5, fields='files(name)').execute()
             files = result.get('files', [])
             
             file_list = '<ul style="text-align: left; display: inline-block;">'
@@ -302,6 +302,6 @@ def get_drive_service():
         return None
     
     try:
-        return build('drive', 'v3', credentials=creds)
+        return build_drive_service(creds)
     except:
         return None
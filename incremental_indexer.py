@@ -90,11 +90,14 @@ class IncrementalIndexer:
         'image/tiff'
     }
     
+    # Drive API limit on sub-requests per batched HTTP request
+    DRIVE_BATCH_LIMIT = 100
+    
     def __init__(
         self,
         tracker_db: str = "./file_tracker.db",
         dry_run: bool = False,
-        batch_size: int = 50
+        batch_size: int = 250
     ):
         """
         Initialize the incremental indexer.
@@ -102,7 +105,8 @@ class IncrementalIndexer:
         Args:
             tracker_db: Path to file tracker SQLite database
             dry_run: If True, only preview changes without making them
-            batch_size: Number of documents to process in each batch
+            batch_size: Number of chunks, across files, embedded and stored per
+                batch (250 fills one Vertex AI embedding request)
         """
         self.dry_run = dry_run
         self.batch_size = batch_size
@@ -122,6 +126,7 @@ class IncrementalIndexer:
             'files_deleted': 0,
             'files_skipped': 0,
             'files_failed': 0,
+            'download_failures': 0,
             'chunks_added': 0,
             'errors': []
         }
@@ -173,65 +178,80 @@ class IncrementalIndexer:
         """Load the configured folders to index."""
         indexed_file = getattr(self, 'INDEXED_FOLDERS_FILE', 'indexed_folders.json')
         if os.path.exists(indexed_file):
-            with open(indexed_file, 'r') as f:
+            with open(indexed_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         return {}
     
     def _get_files_recursive(
         self, 
         folder_id: str, 
-        shared_drive_id: Optional[str] = None,
-        depth: int = 0
+        shared_drive_id: Optional[str] = None
     ) -> List[Dict]:
-        """Recursively get all files from a folder."""
+        """
+        Get all supported files under a folder.
+        
+        Walks the tree one level at a time and lists every folder in that level
+        (plus any follow-up pages) in a single batched HTTP request, so a scan
+        costs one round-trip per level instead of one per folder.
+        """
         all_files = []
         
-        query = f"'{folder_id}' in parents and trashed=false"
-        params = {
-            'q': query,
+        base_params = {
             'spaces': 'drive',
-            'fields': 'files(id, name, mimeType, size, modifiedTime), nextPageToken',
+            'fields': 'files(id, name, mimeType, size, modifiedTime, md5Checksum), nextPageToken',
             'pageSize': 1000,
             'supportsAllDrives': True,
             'includeItemsFromAllDrives': True
         }
         
         if shared_drive_id:
-            params['driveId'] = shared_drive_id
-            params['corpora'] = 'drive'
+            base_params['driveId'] = shared_drive_id
+            base_params['corpora'] = 'drive'
         
-        page_token = None
+        # (folder_id, page_token) listings still to fetch at this level
+        level = [(folder_id, None)]
         
-        while True:
-            try:
-                params['pageToken'] = page_token
-                response = self.drive_service.files().list(**params).execute()
-                
-                items = response.get('files', [])
+        while level:
+            next_level = []
+            
+            for start in range(0, len(level), self.DRIVE_BATCH_LIMIT):
+                batch = self.drive_service.new_batch_http_request()
                 
-                for item in items:
-                    mime_type = item.get('mimeType', '')
+                for parent_id, page_token in level[start:start + self.DRIVE_BATCH_LIMIT]:
+                    def handle_listing(request_id, response, exception, parent_id=parent_id):
+                        if exception is not None:
+                            logger.error(f"Error listing files in folder {parent_id}: {exception}")
+                            self.stats['errors'].append(f"Folder {parent_id}: {str(exception)}")
+                            return
+                        
+                        for item in response.get('files', []):
+                            mime_type = item.get('mimeType', '')
+                            
+                            if mime_type == 'application/vnd.google-apps.folder':
+                                # Subfolder is listed with the next level
+                                next_level.append((item['id'], None))
+                            elif mime_type in self.SUPPORTED_MIME_TYPES:
+                                item['folder_id'] = parent_id
+                                all_files.append(item)
+                        
+                        page_token = response.get('nextPageToken')
+                        if page_token:
+                            next_level.append((parent_id, page_token))
                     
-                    if mime_type == 'application/vnd.google-apps.folder':
-                        # Recurse into subfolder
-                        subfolder_files = self._get_files_recursive(
-                            item['id'],
-                            shared_drive_id,
-                            depth + 1
-                        )
-                        all_files.extend(subfolder_files)
-                    elif mime_type in self.SUPPORTED_MIME_TYPES:
-                        item['folder_id'] = folder_id
-                        all_files.append(item)
+                    request = self.drive_service.files().list(
+                        q=f"'{parent_id}' in parents and trashed=false",
+                        pageToken=page_token,
+                        **base_params
+                    )
+                    batch.add(request, callback=handle_listing)
                 
-                page_token = response.get('nextPageToken')
-                if not page_token:
-                    break
-                    
-            except Exception as e:
-                logger.error(f"Error listing files in folder {folder_id}: {e}")
-                self.stats['errors'].append(f"Folder {folder_id}: {str(e)}")
-                break
+                try:
+                    batch.execute()
+                except Exception as e:
+                    logger.error(f"Error listing files under folder {folder_id}: {e}")
+                    self.stats['errors'].append(f"Folder {folder_id}: {str(e)}")
+            
+            level = next_level
         
         return all_files
     
@@ -255,15 +275,17 @@ class IncrementalIndexer:
         
         try:
             # Extract text based on file type
-            if mime_type == 'application/vnd.google-apps.document':
-                text = self.loader.export_google_doc(file_id)
-            elif mime_type == 'application/vnd.google-apps.presentation':
-                text = self.loader.export_google_slides(file_id)
-            elif mime_type == 'application/vnd.google-apps.spreadsheet':
-                text = self.loader.export_google_sheets(file_id)
+            exporter = self.loader.workspace_exporters.get(mime_type)
+            if exporter:
+                text = exporter(file_id)
+                if text is None:
+                    # Export failed (network, quota) rather than being empty
+                    self.stats['download_failures'] += 1
+                    return None, None
             else:
                 content = self.loader.download_file(file_id)
                 if content is None:
+                    self.stats['download_failures'] += 1
                     return None, None
                 text = extract_text(content, mime_type, file_name, self.loader.ocr_service)
             
@@ -292,7 +314,8 @@ class IncrementalIndexer:
     def _update_chunk_file_name(self, vector_store, file_id: str, new_name: str):
         """Update file_name metadata on existing chunks (rename with unchanged content)."""
         try:
-            existing = vector_store.collection.get(where={"file_id": file_id})
+            # Only the metadata is rewritten; don't pull chunk text out of SQLite
+            existing = vector_store.collection.get(where={"file_id": file_id}, include=["metadatas"])
             ids = existing.get('ids', [])
             metas = existing.get('metadatas', [])
             if ids:
@@ -352,6 +375,34 @@ class IncrementalIndexer:
             self.stats['errors'].append(f"Batch processing: {str(e)}")
             return False
 
+    def _refresh_unchanged_file(
+        self,
+        vector_store,
+        file: Dict,
+        prev: Dict,
+        folder_id: str,
+        folder_name: str,
+        content_hash: Optional[str],
+        chunk_count: int
+    ):
+        """Record a touched-but-unchanged file's new Drive metadata, keeping its embeddings."""
+        if self.dry_run:
+            return
+        if file['name'] != prev.get('file_name'):
+            self._update_chunk_file_name(vector_store, file['id'], file['name'])
+        self.tracker.update_file_state(
+            file_id=file['id'],
+            file_name=file['name'],
+            mime_type=file['mimeType'],
+            folder_id=folder_id,
+            folder_name=folder_name,
+            modified_time=file.get('modifiedTime', ''),
+            chunk_count=chunk_count,
+            content_hash=content_hash,
+            file_size=int(file.get('size', 0) or 0),
+            source_checksum=file.get('md5Checksum')
+        )
+
     def _commit_file_states(self, pending_states: List[Dict]):
         """Commit deferred file tracker updates after successful embedding storage."""
         if self.dry_run:
@@ -427,6 +478,19 @@ class IncrementalIndexer:
                 self.stats['files_skipped'] += 1
                 continue
 
+            source_checksum = file.get('md5Checksum')
+            prev = self.tracker.get_file_state(file_id) if reason != 'new' else None
+
+            if prev and source_checksum and prev.get('source_checksum') == source_checksum:
+                # Same bytes as when indexed (rename, move, sharing change) —
+                # skip the download and extraction as well as the re-embed.
+                logger.info(f"[{idx}/{len(files)}] Source unchanged for {file_name}; skipping download")
+                self._refresh_unchanged_file(folder_vs, file, prev, folder_id, folder_name,
+                                             prev.get('content_hash'), prev.get('chunk_count') or 0)
+                folder_stats['files_skipped'] += 1
+                self.stats['files_skipped'] += 1
+                continue
+
             logger.info(f"[{idx}/{len(files)}] Processing {file_name} ({reason})")
 
             chunks, content_hash = self._extract_and_chunk_file(file, folder_name)
@@ -437,25 +501,12 @@ class IncrementalIndexer:
                 continue
 
             if reason in ['modified', 'content_changed']:
-                prev = self.tracker.get_file_state(file_id)
                 if prev and content_hash and prev.get('content_hash') == content_hash:
                     # Touched in Drive (re-save, comment, rename) but the text is
                     # identical — refresh the tracker, keep existing embeddings.
                     logger.info(f"  Content unchanged for {file_name}; skipping re-embed")
-                    if not self.dry_run:
-                        if file_name != prev.get('file_name'):
-                            self._update_chunk_file_name(folder_vs, file_id, file_name)
-                        self.tracker.update_file_state(
-                            file_id=file_id,
-                            file_name=file_name,
-                            mime_type=file['mimeType'],
-                            folder_id=folder_id,
-                            folder_name=folder_name,
-                            modified_time=modified_time,
-                            chunk_count=prev.get('chunk_count') or len(chunks),
-                            content_hash=content_hash,
-                            file_size=int(file.get('size', 0) or 0)
-                        )
+                    self._refresh_unchanged_file(folder_vs, file, prev, folder_id, folder_name,
+                                                 content_hash, prev.get('chunk_count') or len(chunks))
                     folder_stats['files_skipped'] += 1
                     self.stats['files_skipped'] += 1
                     continue
@@ -463,19 +514,23 @@ class IncrementalIndexer:
                 # Real content change: replace the old chunks
                 self._remove_file_from_index(file_id, vector_store=folder_vs)
 
-            for i, chunk in enumerate(chunks):
-                batch_chunks.append(chunk)
-                batch_metadatas.append({
+            mime_type = file['mimeType']
+            total_chunks = len(chunks)
+            batch_chunks.extend(chunks)
+            batch_metadatas.extend(
+                {
                     'file_id': file_id,
                     'file_name': file_name,
                     'folder_id': folder_id,
                     'folder_name': folder_name,
-                    'mime_type': file['mimeType'],
+                    'mime_type': mime_type,
                     'chunk_index': i,
-                    'total_chunks': len(chunks),
+                    'total_chunks': total_chunks,
                     'modified_time': modified_time
-                })
-                batch_ids.append(f"{file_id}_chunk_{i}")
+                }
+                for i in range(total_chunks)
+            )
+            batch_ids.extend(f"{file_id}_chunk_{i}" for i in range(total_chunks))
 
             # Defer tracker update until embeddings are stored successfully
             pending_file_states.append({
@@ -487,7 +542,8 @@ class IncrementalIndexer:
                 'modified_time': modified_time,
                 'chunk_count': len(chunks),
                 'content_hash': content_hash,
-                'file_size': int(file.get('size', 0))
+                'file_size': int(file.get('size', 0)),
+                'source_checksum': source_checksum
             })
 
             if reason == 'new':
@@ -533,6 +589,43 @@ class IncrementalIndexer:
         
         return folder_stats
     
+    def _check_drive_changes(self, indexed_folders: Dict) -> Tuple[bool, Optional[str]]:
+        """
+        Ask the Drive Changes API whether anything changed since the last
+        completed sync, instead of relisting every folder to find out.
+        
+        Returns:
+            (changed, start_token): changed is False only when the stored page
+            token shows no changes and the configured folders are the same as
+            at that sync. start_token marks "now" and should be stored once
+            this sync completes (None if the Changes API is unavailable).
+        """
+        folders_key = json.dumps(sorted(indexed_folders))
+        token = self.tracker.get_sync_state('drive_changes_token')
+        
+        try:
+            if token and self.tracker.get_sync_state('drive_changes_folders') == folders_key:
+                response = self.drive_service.changes().list(
+                    pageToken=token,
+                    pageSize=1,
+                    spaces='drive',
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True,
+                    fields='nextPageToken, newStartPageToken, changes(fileId)'
+                ).execute()
+                if not response.get('changes') and response.get('newStartPageToken'):
+                    return False, response['newStartPageToken']
+            
+            # Taken before the folder scans, so edits made during this sync
+            # show up as changes next time
+            start_token = self.drive_service.changes().getStartPageToken(
+                supportsAllDrives=True
+            ).execute().get('startPageToken')
+            return True, start_token
+        except Exception as e:
+            logger.warning(f"Drive Changes API unavailable, scanning all folders: {e}")
+            return True, None
+    
     def run_full_sync(self) -> Dict:
         """
         Run full incremental sync on all configured folders.
@@ -571,6 +664,20 @@ class IncrementalIndexer:
         
         logger.info(f"Found {len(indexed_folders)} configured folders")
         
+        # Skip the per-folder listings entirely when Drive reports no changes
+        changed, changes_token = self._check_drive_changes(indexed_folders)
+        if not changed:
+            logger.info("No Drive changes since last sync; skipping folder scans")
+            if session_id is not None:
+                self.tracker.set_sync_state('drive_changes_token', changes_token)
+                self.tracker.complete_sync_session(
+                    session_id=session_id, status='completed',
+                    files_checked=0, files_added=0, files_updated=0,
+                    files_deleted=0, files_skipped=0, folders_scanned=0,
+                    errors=None
+                )
+            return self.stats
+        
         # Sync each folder
         for folder_id, folder_info in indexed_folders.items():
             try:
@@ -587,6 +694,14 @@ class IncrementalIndexer:
         # Complete sync session
         duration = time.time() - start_time
         
+        # Only a clean sync moves the changes cursor forward; otherwise the
+        # next run scans every folder again. Failed downloads/exports count
+        # too, since those files would not show up in the changes feed again.
+        sync_clean = not self.stats['errors'] and not self.stats['download_failures']
+        if session_id is not None and changes_token and sync_clean:
+            self.tracker.set_sync_state('drive_changes_token', changes_token)
+            self.tracker.set_sync_state('drive_changes_folders', json.dumps(sorted(indexed_folders)))
+        
         if session_id is not None:
             self.tracker.complete_sync_session(
                 session_id=session_id,
@@ -610,7 +725,8 @@ class IncrementalIndexer:
         logger.info(f"Files updated: {self.stats['files_updated']}")
         logger.info(f"Files skipped (up-to-date): {self.stats['files_skipped']}")
         logger.info(f"Files deleted: {self.stats['files_deleted']}")
-        logger.info(f"Files failed: {self.stats['files_failed']}")
+        logger.info(f"Files failed: {self.stats['files_failed']} "
+                   f"({self.stats['download_failures']} download/export errors)")
         logger.info(f"Chunks added: {self.stats['chunks_added']}")
         if self.stats['errors']:
             logger.warning(f"Errors: {len(self.stats['errors'])}")
@@ -689,8 +805,8 @@ Examples:
     parser.add_argument(
         '--batch-size',
         type=int,
-        default=50,
-        help='Number of documents to process in each batch (default: 50)'
+        default=250,
+        help='Number of chunks to embed and store per batch (default: 250)'
     )
     
     args = parser.parse_args()
@@ -37,12 +37,27 @@ import time
 import re
 from difflib import SequenceMatcher
 import traceback
+import logging
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+except ImportError:
+    _json_dumps = json.dumps
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.panel import Panel
 from functools import lru_cache
 import hashlib
+import io
+import heapq
+from operator import itemgetter
+import numpy as np
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 
 # Fix Windows console encoding for Unicode characters
 if os.name == 'nt':  # Windows
@@ -53,36 +68,113 @@ if os.name == 'nt':  # Windows
     except (AttributeError, OSError):
         pass
 
+# Common emoji -> ASCII equivalents for consoles that can't encode them
+_EMOJI_FALLBACK = str.maketrans({
+    '👤': '[USER]',
+    '🤖': '[AI]',
+    '🔍': '[SEARCH]',
+    '📊': '[STATS]',
+    '⚡': '[FAST]',
+    '💡': '[INFO]',
+    '🎯': '[TARGET]',
+    '📚': '[DOCS]',
+    '🧠': '[AI]',
+    '👁': '[VIEW]',
+    '🔧': '[TOOL]',
+    '⏰': '[TIME]',
+})
+
 def safe_print(*args, **kwargs):
     """Safe print function that handles Unicode encoding errors on Windows"""
     try:
         print(*args, **kwargs)
     except UnicodeEncodeError:
-        # Fallback: replace problematic Unicode characters
-        safe_args = []
-        for arg in args:
-            if isinstance(arg, str):
-                # Replace common emoji with ASCII equivalents
-                safe_arg = (arg.replace('👤', '[USER]')
-                             .replace('🤖', '[AI]')
-                             .replace('🔍', '[SEARCH]')
-                             .replace('📊', '[STATS]')
-                             .replace('⚡', '[FAST]')
-                             .replace('💡', '[INFO]')
-                             .replace('🎯', '[TARGET]')
-                             .replace('📚', '[DOCS]')
-                             .replace('🧠', '[AI]')
-                             .replace('👁', '[VIEW]')
-                             .replace('🔧', '[TOOL]')
-                             .replace('⏰', '[TIME]'))
-                safe_args.append(safe_arg)
-            else:
-                safe_args.append(str(arg))
+        # Fallback: replace problematic Unicode characters in one pass per argument
+        safe_args = [arg.translate(_EMOJI_FALLBACK) if isinstance(arg, str) else str(arg) for arg in args]
         print(*safe_args, **kwargs)
 
 # Initialize rich console for beautiful output
 console = Console()
 
+# Per-query progress from the multi-collection search goes through logging so
+# library callers (chat_api) only see warnings; interactive_mode turns on INFO.
+logger = logging.getLogger(__name__)
+
+# Multi-collection query intent keywords (substring-matched against the question)
+TIME_OFF_KEYWORDS = frozenset({
+    'holiday', 'holidays', 'pto', 'vacation', 'time off', 'leave', 'day off', 'days off'
+})
+BENEFITS_KEYWORDS = frozenset({
+    'benefit', 'benefits', 'insurance', 'healthcare', 'health care', 'dental', 'vision',
+    '401k', 'retirement'
+})
+PROCEDURE_KEYWORDS = frozenset({
+    'procedure', 'process', 'how to', 'steps to', 'guideline', 'guidelines'
+})
+# Titles/paths containing these get the policy-document boost
+POLICY_DOCUMENT_KEYWORDS = frozenset({
+    'handbook', 'policy', 'policies', 'hr', 'human resource', 'employee', 'benefits',
+    'manual', 'guide'
+})
+
+
+def _keyword_pattern(keywords):
+    """Compile a keyword set into one alternation so a single scan finds any of them."""
+    return re.compile('|'.join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True)))
+
+
+TIME_OFF_PATTERN = _keyword_pattern(TIME_OFF_KEYWORDS)
+BENEFITS_PATTERN = _keyword_pattern(BENEFITS_KEYWORDS)
+PROCEDURE_PATTERN = _keyword_pattern(PROCEDURE_KEYWORDS)
+POLICY_DOCUMENT_PATTERN = _keyword_pattern(POLICY_DOCUMENT_KEYWORDS)
+
+
+# Common expansions for business terms (used by EnhancedRAGSystem._expand_query)
+QUERY_EXPANSIONS = [
+    (re.compile(pattern, re.IGNORECASE), replacement)
+    for pattern, replacement in (
+        (r'\bmarkets?\b', 'markets regions territories areas'),
+        (r'\bprojects?\b', 'projects initiatives campaigns programs'),
+        (r'\breports?\b', 'reports summaries analyses documents'),
+        (r'\bsales?\b', 'sales revenue earnings income'),
+        (r'\bbudgets?\b', 'budgets forecasts projections estimates'),
+        (r'\bclients?\b', 'clients customers accounts'),
+    )
+]
+
+# Synthesis-query indicators and their weights (strong 1.0, moderate 0.6, weak 0.3)
+SYNTHESIS_WORD_INDICATORS = {
+    'summarize': 1.0, 'summary': 1.0, 'summaries': 1.0,
+    'compare': 1.0, 'comparison': 1.0, 'versus': 1.0, 'vs': 1.0,
+    'differences': 0.6, 'similarities': 0.6,
+    'across': 0.6, 'between': 0.6,
+    'overview': 0.6, 'aggregate': 0.6,
+    'all': 0.3, 'every': 0.3, 'each': 0.3,
+}
+SYNTHESIS_PHRASE_INDICATORS = {
+    'list all': 1.0, 'show all': 1.0, 'tell me about all': 1.0,
+    'all reports': 1.0, 'all markets': 1.0, 'all projects': 1.0,
+}
+
+# Extra search terms appended to the question for each detected intent
+INTENT_QUERY_SUFFIXES = {
+    'time_off': "employee policy handbook HR benefits time off leave vacation",
+    'benefits': "employee benefits policy handbook HR compensation",
+    'procedure': "procedure process guidelines documentation handbook",
+}
+
+
+@lru_cache(maxsize=1024)
+def _detect_query_intent(question_lower: str):
+    """Return the intent key for a lowercased question, or None."""
+    if TIME_OFF_PATTERN.search(question_lower):
+        return 'time_off'
+    if BENEFITS_PATTERN.search(question_lower):
+        return 'benefits'
+    if PROCEDURE_PATTERN.search(question_lower):
+        return 'procedure'
+    return None
+
 # Query Cache for API cost optimization
 class QueryCache:
     """Simple time-based cache for query results to reduce API calls."""
@@ -307,6 +399,36 @@ def _get_generative_model(model_name=None):
         return genai.GenerativeModel(model_name)
 
 
+_shared_embedding_models = None
+_shared_embedding_models_lock = threading.Lock()
+
+
+def _get_shared_embedding_models():
+    """
+    Return the process-wide (embedder, reranker) pair, creating it on first use.
+    They hold no per-collection state, so one Vertex client / local model load
+    serves every EnhancedRAGSystem instead of one per collection.
+    """
+    global _shared_embedding_models
+    with _shared_embedding_models_lock:
+        if _shared_embedding_models is None:
+            # Load embeddings based on config
+            print("Loading embeddings...")
+            if USE_VERTEX_EMBEDDINGS:
+                from vertex_embeddings import VertexEmbedder, VertexReranker
+                print("  🌐 Using Vertex AI Embeddings (production-grade)")
+                embedder = VertexEmbedder()
+                print("Loading re-ranking model...")
+                reranker = VertexReranker(embedder)
+            else:
+                print("  💻 Using Local Embeddings (development mode)")
+                embedder = LocalEmbedder()
+                print("Loading re-ranking model...")
+                reranker = LocalReranker()
+            _shared_embedding_models = (embedder, reranker)
+        return _shared_embedding_models
+
+
 class MultiCollectionRAGSystem:
     """
     Multi-Collection RAG System that can search across all available collections
@@ -316,17 +438,39 @@ class MultiCollectionRAGSystem:
         """
         Initialize the multi-collection RAG system.
         """
-        print(f"Initializing Multi-Collection RAG Agent for {len(available_collections)} collections...")
+        logger.info(f"Initializing Multi-Collection RAG Agent for {len(available_collections)} collections...")
         
         self.drive_service = drive_service
         self.collection_name = "ALL_COLLECTIONS"
         self.available_collections = available_collections
         self.collection_systems = {}
         
+        # Routing replies name a collection; map lowercased names to IDs once
+        # so matching the reply is a single dict lookup instead of a scan.
+        self._collection_id_by_name = {
+            info['name'].lower(): coll_id
+            for coll_id, info in available_collections.items()
+        }
+        # Questions that name exactly one collection can skip the routing LLM call.
+        # Only multi-word names qualify: a single word like "sales" or "training"
+        # shows up in questions that are not about that folder at all.
+        routable_names = sorted(
+            (name for name in self._collection_id_by_name if len(name.split()) >= 2),
+            key=len, reverse=True
+        )
+        self._collection_name_pattern = re.compile(
+            r'\b(' + '|'.join(re.escape(name) for name in routable_names) + r')\b'
+        ) if routable_names else None
+        # The collection list in the routing prompt never changes after startup
+        self._routing_collections_text = "\n".join(
+            f"- {info['name']}: {info['location']} ({info.get('files_processed', 0)} files)"
+            for info in available_collections.values()
+        )
+        
         # Configure authentication based on USE_VERTEX_AI setting
         if USE_VERTEX_AI:
             # Vertex AI uses GOOGLE_APPLICATION_CREDENTIALS environment variable
-            print("  🌐 Using Vertex AI authentication (GOOGLE_APPLICATION_CREDENTIALS)")
+            logger.info("  🌐 Using Vertex AI authentication (GOOGLE_APPLICATION_CREDENTIALS)")
         else:
             # Consumer API requires GOOGLE_API_KEY
             if not api_key:
@@ -336,30 +480,69 @@ class MultiCollectionRAGSystem:
         # Initialize AI model for collection routing
         self.routing_model = _get_generative_model('gemini-2.0-flash-exp')
         
-        # Initialize individual RAG systems for each collection
-        for collection_name, collection_info in available_collections.items():
-            print(f"  → Loading collection: {collection_info['name']}")
-            try:
-                self.collection_systems[collection_name] = EnhancedRAGSystem(
-                    drive_service, collection_name, api_key
-                )
-            except Exception as e:
-                print(f"  ⚠️  Failed to load collection {collection_name}: {e}")
+        # Individual RAG systems are built on first use (see _get_collection_system)
+        # so startup doesn't pay for every collection up front. A background
+        # thread warms them, largest collections first, while the agent is idle.
+        self.api_key = api_key
+        self._collection_load_locks = {name: threading.Lock() for name in available_collections}
+        self._failed_collections = {}
+        prefetch_order = sorted(
+            available_collections,
+            key=lambda name: available_collections[name].get('files_processed', 0),
+            reverse=True
+        )
+        threading.Thread(
+            target=self._prefetch_collections, args=(prefetch_order,),
+            name="collection-prefetch", daemon=True
+        ).start()
         
-        print(f"[+] Multi-Collection Agent Ready! {len(self.collection_systems)} collections active.")
+        logger.info(f"[+] Multi-Collection Agent Ready! {len(available_collections)} collections (loading on demand).")
+    
+    def _get_collection_system(self, collection_name):
+        """
+        Return the EnhancedRAGSystem for a collection, building it on first use.
+        Returns None if the collection failed to load; failures are not retried.
+        """
+        system = self.collection_systems.get(collection_name)
+        if system is not None or collection_name in self._failed_collections:
+            return system
+        
+        with self._collection_load_locks[collection_name]:
+            system = self.collection_systems.get(collection_name)
+            if system is None and collection_name not in self._failed_collections:
+                logger.info(f"  → Loading collection: {self.available_collections[collection_name]['name']}")
+                try:
+                    system = EnhancedRAGSystem(self.drive_service, collection_name, self.api_key)
+                except Exception as e:
+                    logger.warning(f"  ⚠️  Failed to load collection {collection_name}: {e}")
+                    self._failed_collections[collection_name] = e
+                    return None
+                self.collection_systems[collection_name] = system
+        return system
+    
+    def _prefetch_collections(self, collection_names):
+        """Warm collection systems in the background; queries load any still missing."""
+        for collection_name in collection_names:
+            self._get_collection_system(collection_name)
     
     def _route_to_best_collection(self, question: str):
         """
         Use AI to determine which collection is most likely to answer the question.
         Returns the collection_name and confidence score.
         """
+        if self._collection_name_pattern:
+            named = {
+                self._collection_id_by_name[name]
+                for name in self._collection_name_pattern.findall(question.lower())
+            }
+            if len(named) == 1:
+                matched_id = named.pop()
+                logger.info(f"\n  🎯 Routing: question names '{self.available_collections[matched_id]['name']}' - skipping AI routing")
+                # A name match is a hint, not certainty - route, but only just
+                return matched_id, min(1.0, AI_ROUTING_CONFIDENCE_THRESHOLD + 0.05)
+        
         try:
-            # Build collection descriptions
-            collection_descriptions = []
-            for coll_id, coll_info in self.available_collections.items():
-                collection_descriptions.append(f"- {coll_info['name']}: {coll_info['location']} ({coll_info.get('files_processed', 0)} files)")
-            
-            collections_text = "\n".join(collection_descriptions)
+            collections_text = self._routing_collections_text
             
             prompt = f"""Given this user question, determine which document collection is MOST LIKELY to contain the answer.
 
@@ -399,22 +582,18 @@ Respond ONLY with the JSON object, no other text."""
             reasoning = routing_result.get('reasoning', '')
             
             # Match collection name to ID
-            matched_id = None
-            for coll_id, coll_info in self.available_collections.items():
-                if coll_info['name'].lower() == best_collection_name.lower():
-                    matched_id = coll_id
-                    break
+            matched_id = self._collection_id_by_name.get(best_collection_name.strip().lower())
             
             if matched_id and confidence > AI_ROUTING_CONFIDENCE_THRESHOLD:  # Use config threshold
-                print(f"\n  🎯 AI Routing: {best_collection_name} (confidence: {confidence:.0%})")
-                print(f"     Reasoning: {reasoning}")
+                logger.info(f"\n  🎯 AI Routing: {best_collection_name} (confidence: {confidence:.0%})")
+                logger.info(f"     Reasoning: {reasoning}")
                 return matched_id, confidence
             else:
-                print(f"\n  🔀 AI Routing: Low confidence ({confidence:.0%}) - searching all collections")
+                logger.info(f"\n  🔀 AI Routing: Low confidence ({confidence:.0%}) - searching all collections")
                 return None, confidence
                 
         except Exception as e:
-            print(f"\n  ⚠️  Collection routing failed: {e}")
+            logger.warning(f"\n  ⚠️  Collection routing failed: {e}")
             import traceback
             traceback.print_exc()
             return None, 0.0
@@ -427,10 +606,10 @@ Respond ONLY with the JSON object, no other text."""
             question: The user's question
             file_id: Optional file ID to filter results to a specific file
         """
-        print(f"\n🔍 Multi-Collection Search: '{question[:50]}...'")
+        logger.info(f"\n🔍 Multi-Collection Search: '{question[:50]}...'")
         
         if file_id:
-            print(f"  📄 Filtering to specific file: {file_id}")
+            logger.info(f"  📄 Filtering to specific file: {file_id}")
         
         # Step 1: Use AI to route to best collection (if enabled)
         best_collection_id = None
@@ -439,80 +618,92 @@ Respond ONLY with the JSON object, no other text."""
         if ENABLE_AI_ROUTING:
             best_collection_id, routing_confidence = self._route_to_best_collection(question)
         else:
-            print(f"  ℹ️  AI routing disabled (set ENABLE_AI_ROUTING=True in config.py to enable)")
+            logger.info(f"  ℹ️  AI routing disabled (set ENABLE_AI_ROUTING=True in config.py to enable)")
         
         # Enhance query for better semantic matching
         # Add context keywords to help distinguish different types of information
         enhanced_question = question
         
         # Detect query intent and add context - be more aggressive with detection
-        question_lower = question.lower()
-        if any(word in question_lower for word in ['holiday', 'holidays', 'pto', 'vacation', 'time off', 'leave', 'day off', 'days off']):
-            # HR/policy query - ALWAYS enhance for holidays/PTO questions
-            enhanced_question = f"{question} employee policy handbook HR benefits time off leave vacation"
-            print(f"  🎯 Detected HR policy query (time off/holidays), enhanced search")
-        elif any(word in question_lower for word in ['benefit', 'benefits', 'insurance', 'healthcare', 'health care', 'dental', 'vision', '401k', 'retirement']):
-            enhanced_question = f"{question} employee benefits policy handbook HR compensation"
-            print(f"  🎯 Detected benefits query, enhanced search")
-        elif any(word in question_lower for word in ['procedure', 'process', 'how to', 'steps to', 'guideline', 'guidelines']):
-            enhanced_question = f"{question} procedure process guidelines documentation handbook"
-            print(f"  🎯 Detected procedure query, enhanced search")
+        intent = _detect_query_intent(question.lower())
+        if intent:
+            # HR/policy queries (holidays/PTO, benefits, procedures) - ALWAYS enhance
+            enhanced_question = f"{question} {INTENT_QUERY_SUFFIXES[intent]}"
+            logger.info(f"  🎯 Detected {intent.replace('_', ' ')} query, enhanced search")
         
         all_results = []
         collection_results = {}
         
         # Search each collection (prioritize routed collection if confident)
-        search_order = list(self.collection_systems.keys())
+        search_order = [name for name in self.available_collections if name not in self._failed_collections]
         if best_collection_id and routing_confidence > AI_ROUTING_CONFIDENCE_THRESHOLD:
             # Move best collection to front for priority search
             if best_collection_id in search_order:
                 search_order.remove(best_collection_id)
                 search_order.insert(0, best_collection_id)
         
-        for collection_name in search_order:
-            rag_system = self.collection_systems[collection_name]
+        is_routed = bool(best_collection_id) and routing_confidence > AI_ROUTING_CONFIDENCE_THRESHOLD
+        
+        def search_collection(collection_name):
+            is_primary = is_routed and collection_name == best_collection_id
+            collection_info = self.available_collections[collection_name]
+            # Get more results from primary collection
+            top_k = 12 if is_primary else 6
+            system = self._get_collection_system(collection_name)
+            if system is None:
+                return None, self._failed_collections[collection_name]
             try:
-                is_primary = (collection_name == best_collection_id and routing_confidence > AI_ROUTING_CONFIDENCE_THRESHOLD)
-                print(f"  → Searching {self.available_collections[collection_name]['name']}{'  [PRIMARY TARGET 🎯]' if is_primary else ''}...")
-                
-                # Get more results from primary collection
-                top_k = 12 if is_primary else 6
-                
-                # Use the existing search_documents function with enhanced query
-                results = rag_system.search_documents(enhanced_question, top_k=top_k, file_id=file_id)
-                
-                if results:
-                    # Tag results with collection info - don't boost yet, reranking will reset scores
-                    for result in results:
-                        result['collection_name'] = collection_name
-                        result['collection_display'] = self.available_collections[collection_name]['name']
-                        result['collection_location'] = self.available_collections[collection_name]['location']
-                        result['is_primary_collection'] = is_primary  # Tag for later boosting
-                    
-                    all_results.extend(results)
-                    collection_results[collection_name] = len(results)
-                    print(f"    ✓ Found {len(results)} results")
-                else:
-                    collection_results[collection_name] = 0
-                    print(f"    - No results")
-                    
+                # Use the existing search_documents function with enhanced query;
+                # results come back already tagged with collection info - don't
+                # boost yet, reranking will reset scores
+                return system.search_documents(
+                    enhanced_question, top_k=top_k, file_id=file_id,
+                    extra_fields={
+                        'collection_name': collection_name,
+                        'collection_display': collection_info['name'],
+                        'collection_location': collection_info['location'],
+                        'is_primary_collection': is_primary,  # Tag for later boosting
+                    }
+                ), None
             except Exception as e:
-                print(f"    ⚠️  Error searching {collection_name}: {e}")
+                return None, e
+        
+        # Collections are independent and each search is dominated by embedding
+        # and ChromaDB round-trips, so fan them out and merge in priority order
+        logger.info(f"  → Searching {len(search_order)} collections in parallel...")
+        with ThreadPoolExecutor(max_workers=max(1, min(16, len(search_order)))) as executor:
+            search_outcomes = list(executor.map(search_collection, search_order))
+        
+        for collection_name, (results, error) in zip(search_order, search_outcomes):
+            collection_info = self.available_collections[collection_name]
+            is_primary = is_routed and collection_name == best_collection_id
+            label = f"{collection_info['name']}{'  [PRIMARY TARGET 🎯]' if is_primary else ''}"
+            
+            if error is not None:
+                logger.warning(f"    ⚠️  Error searching {collection_name}: {error}")
+                collection_results[collection_name] = 0
+            elif results:
+                all_results.extend(results)
+                collection_results[collection_name] = len(results)
+                logger.info(f"    ✓ {label}: {len(results)} results")
+            else:
                 collection_results[collection_name] = 0
+                logger.info(f"    - {label}: no results")
         
         if not all_results:
-            print("  No results found across any collection")
+            logger.info("  No results found across any collection")
             summary_info = {
                 'total_results': 0,
-                'collections_searched': len(self.collection_systems),
+                'collections_searched': len(search_order),
                 'collection_breakdown': collection_results,
                 'top_collections': []
             }
             return [], summary_info
         
-        # Re-rank all results together using the first collection's reranker
-        if len(self.collection_systems) > 0:
-            first_system = next(iter(self.collection_systems.values()))
+        # Re-rank all results together using the reranker shared by every collection
+        # (collection_systems may still be filling in from the prefetch thread)
+        if self.collection_systems:
+            reranker = _get_shared_embedding_models()[1]
             
             # Prepare content for reranking
             contents = []
@@ -523,8 +714,8 @@ Respond ONLY with the JSON object, no other text."""
             try:
                 # Re-rank across all collections using ORIGINAL question (not enhanced)
                 # Enhanced query helps retrieval but confuses reranking
-                reranked_scores = first_system.reranker.rerank(question, contents)
-                print(f"  🔄 Reranked {len(contents)} results using original query")
+                reranked_scores = reranker.rerank(question, contents)
+                logger.info(f"  🔄 Reranked {len(contents)} results using original query")
                 
                 # Apply new scores - handle dict or float format
                 for i, result in enumerate(all_results):
@@ -537,23 +728,20 @@ Respond ONLY with the JSON object, no other text."""
                             result['score'] = float(score_item)
                         result['rerank_score'] = result['score']  # Store original rerank score for debugging
                 
-                # Sort by new scores - use safe key function
-                all_results.sort(key=lambda x: float(x.get('score', 0)) if isinstance(x.get('score', 0), (int, float, str)) else 0, reverse=True)
-                
                 # Log initial score range
                 if all_results:
-                    min_score = min(float(r.get('score', 0)) for r in all_results)
-                    max_score = max(float(r.get('score', 0)) for r in all_results)
+                    min_score = min(r['score'] for r in all_results)
+                    max_score = max(r['score'] for r in all_results)
                     score_range = max_score - min_score
-                    print(f"\n  📊 Score range before boosting: {min_score:.2f} to {max_score:.2f} (range: {score_range:.2f})")
+                    logger.info(f"\n  📊 Score range before boosting: {min_score:.2f} to {max_score:.2f} (range: {score_range:.2f})")
                 
                 # Apply ADDITIVE boosting (not multiplicative) - works correctly with negative scores
-                print(f"\n  📚 Applying smart boosting...")
+                logger.info(f"\n  📚 Applying smart boosting...")
                 for result in all_results:
                     title = result.get('title', '').lower()
                     metadata = result.get('metadata', {})
                     file_path = metadata.get('source', '').lower()
-                    original_score = float(result.get('score', 0))
+                    original_score = result['score']
                     
                     # Additive boosts - add fixed amounts instead of multiplying
                     boost_amount = 0
@@ -565,21 +753,17 @@ Respond ONLY with the JSON object, no other text."""
                         boost_reasons.append("primary collection (+2.0)")
                     
                     # Layer 2: Policy/handbook document boost (strong boost for HR documents)
-                    if any(keyword in title or keyword in file_path for keyword in 
-                           ['handbook', 'policy', 'policies', 'hr', 'human resource', 'employee', 'benefits', 'manual', 'guide']):
+                    if POLICY_DOCUMENT_PATTERN.search(title) or POLICY_DOCUMENT_PATTERN.search(file_path):
                         boost_amount += 8.0  # Add +8.0 to score (massive boost to overcome bad rerank scores)
                         boost_reasons.append("policy document (+8.0)")
                     
                     if boost_amount > 0:
                         result['score'] = original_score + boost_amount
                         boost_desc = ", ".join(boost_reasons)
-                        print(f"    🔼 {title[:40]}... ({boost_desc}): {original_score:.2f} → {result['score']:.2f}")
-                
-                # Re-sort after boosting
-                all_results.sort(key=lambda x: float(x.get('score', 0)) if isinstance(x.get('score', 0), (int, float, str)) else 0, reverse=True)
+                        logger.info(f"    🔼 {title[:40]}... ({boost_desc}): {original_score:.2f} → {result['score']:.2f}")
                 
             except Exception as e:
-                print(f"  ⚠️  Reranking failed, using original scores: {e}")
+                logger.warning(f"  ⚠️  Reranking failed, using original scores: {e}")
                 import traceback
                 traceback.print_exc()
                 # Try to normalize existing scores before sorting
@@ -593,73 +777,94 @@ Respond ONLY with the JSON object, no other text."""
                     except (ValueError, TypeError):
                         result['score'] = 0.0
         
+        # Every score is a float from here on (search_documents parses relevance,
+        # reranking/fallback above overwrite or normalize it), so rank on the
+        # stored value directly instead of re-parsing it in every comparison
+        score_key = itemgetter('score')
+        
         # Smart filtering: Remove extremely low scoring results while keeping reasonable diversity
         # Cross-encoder scores can be negative, so we filter relative to the top score
         if all_results:
-            # Sort by score first to get proper top score
-            all_results_sorted = sorted(all_results, key=lambda x: float(x.get('score', -999)) if isinstance(x.get('score', 0), (int, float)) else -999, reverse=True)
+            # Only the head of the ranking is ever used, so select it with a
+            # heap instead of sorting every result from every collection
+            top_results = heapq.nlargest(8, all_results, key=score_key)
             
-            top_score = float(all_results_sorted[0].get('score', -999)) if all_results_sorted else -999
+            top_score = top_results[0]['score']
             # Keep results within reasonable range of top score - more aggressive filtering
             score_threshold = top_score - 2.0  # Keep results within 2 points of top score (tightened from 3)
             
-            print(f"\n  📊 Top 5 results before filtering:")
-            for i, r in enumerate(all_results_sorted[:5]):
-                score = r.get('score', 0)
-                title = r.get('title', 'Untitled')[:40]
-                coll = r.get('collection_display', 'Unknown')
-                print(f"     {i+1}. [{coll}] {title}... (score: {score:.2f})")
-            
-            filtered_results = [r for r in all_results_sorted if float(r.get('score', -999)) >= score_threshold]
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"\n  📊 Top 5 results before filtering:")
+                for i, r in enumerate(top_results[:5]):
+                    score = r.get('score', 0)
+                    title = r.get('title', 'Untitled')[:40]
+                    coll = r.get('collection_display', 'Unknown')
+                    logger.info(f"     {i+1}. [{coll}] {title}... (score: {score:.2f})")
+            
+            filtered_results = sorted(
+                (r for r in all_results if r['score'] >= score_threshold),
+                key=score_key, reverse=True
+            )
             
             # Ensure we have at least 5 results even if filtering is aggressive
             if len(filtered_results) < 5:
-                filtered_results = all_results_sorted[:8]
+                filtered_results = top_results
             
-            print(f"\n  📏 Score threshold: {score_threshold:.2f} (top: {top_score:.2f}) - keeping {len(filtered_results)}/{len(all_results_sorted)} results")
+            logger.info(f"\n  📏 Score threshold: {score_threshold:.2f} (top: {top_score:.2f}) - keeping {len(filtered_results)}/{len(all_results)} results")
         else:
             filtered_results = []
         
         # Ensure collection diversity - don't return all results from just one collection
-        collection_counts = {}
+        collection_counts = defaultdict(int)
         diverse_results = []
         MAX_PER_COLLECTION = 5  # Max results from any single collection
+        MAX_SOURCES = 6  # Reduced for more focused, high-quality answers
+        
+        seen_chunks = set()
         
         for result in filtered_results:
-            coll = result.get('collection_name', 'unknown')
-            if coll not in collection_counts:
-                collection_counts[coll] = 0
+            # A file can be indexed under more than one collection (nested
+            # folders); keep only its best-scoring copy of each chunk
+            metadata = result.get('metadata', {})
+            chunk_key = (metadata.get('file_id') or result.get('title'), metadata.get('chunk_index'))
+            if chunk_key in seen_chunks:
+                continue
+            seen_chunks.add(chunk_key)
             
+            coll = result.get('collection_name', 'unknown')
             if collection_counts[coll] < MAX_PER_COLLECTION:
                 diverse_results.append(result)
                 collection_counts[coll] += 1
+                # Results arrive best-first, so stop once we have enough
+                if len(diverse_results) >= MAX_SOURCES:
+                    break
         
         # Take top results after diversity filtering
-        MAX_SOURCES = 6  # Reduced for more focused, high-quality answers
-        final_results = diverse_results[:MAX_SOURCES]
+        final_results = diverse_results
         
-        print(f"\n  ✅ Final {len(final_results)} sources selected:")
-        for i, r in enumerate(final_results):
-            title = r.get('title', 'Untitled')[:50]
-            coll = r.get('collection_display', 'Unknown')[:30]
-            score = r.get('score', 0)
-            print(f"     {i+1}. [{coll}] {title}... (score: {score:.2f})")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"\n  ✅ Final {len(final_results)} sources selected:")
+            for i, r in enumerate(final_results):
+                title = r.get('title', 'Untitled')[:50]
+                coll = r.get('collection_display', 'Unknown')[:30]
+                score = r.get('score', 0)
+                logger.info(f"     {i+1}. [{coll}] {title}... (score: {score:.2f})")
         
         # Add summary info
         summary_info = {
             'total_results': len(all_results),
-            'collections_searched': len(self.collection_systems),
+            'collections_searched': len(search_order),
             'collection_breakdown': collection_results,
             'top_collections': sorted(collection_results.items(), key=lambda x: x[1], reverse=True)[:3],
-            'min_score': min([float(r.get('score', 0)) for r in final_results if isinstance(r.get('score', 0), (int, float))]) if final_results else 0,
-            'max_score': max([float(r.get('score', 0)) for r in final_results if isinstance(r.get('score', 0), (int, float))]) if final_results else 0
+            'min_score': min(r['score'] for r in final_results) if final_results else 0,
+            'max_score': max(r['score'] for r in final_results) if final_results else 0
         }
         
-        print(f"  ✓ Combined {len(all_results)} results from {len(self.collection_systems)} collections")
-        print(f"  📋 After filtering & diversity: {len(final_results)} results from {len(collection_counts)} collections")
-        print(f"  → Scores: {summary_info['min_score']:.2f} to {summary_info['max_score']:.2f}")
+        logger.info(f"  ✓ Combined {len(all_results)} results from {len(search_order)} collections")
+        logger.info(f"  📋 After filtering & diversity: {len(final_results)} results from {len(collection_counts)} collections")
+        logger.info(f"  → Scores: {summary_info['min_score']:.2f} to {summary_info['max_score']:.2f}")
         for coll, count in collection_counts.items():
-            print(f"     • {self.available_collections.get(coll, {}).get('name', coll)}: {count} results")
+            logger.info(f"     • {self.available_collections.get(coll, {}).get('name', coll)}: {count} results")
         
         return final_results, summary_info
     
@@ -685,12 +890,9 @@ Respond ONLY with the JSON object, no other text."""
                     'multi_collection_summary': summary_info
                 }
             
-            # Use the first collection's system for Gemini processing
-            first_system = next(iter(self.collection_systems.values()))
-            
             # Build context from multi-collection results
             # CSVs/spreadsheets are now stored as complete single chunks (no multi-chunk loading needed)
-            context_parts = []
+            context_buf = io.StringIO()
             sources = []
             
             for i, result in enumerate(search_results):
@@ -709,7 +911,7 @@ Respond ONLY with the JSON object, no other text."""
                 is_complete_file = 'COMPLETE FILE' in snippet[:300] if snippet else False
                 
                 if (is_spreadsheet or is_csv_filename) and is_complete_file:
-                    print(f"  📊 Spreadsheet: {title} (complete file, single chunk)")
+                    logger.info(f"  📊 Spreadsheet: {title} (complete file, single chunk)")
                 
                 # Regular handling - CSVs are now complete in single chunks
                 # Check if this is a chunk (partial document)
@@ -722,14 +924,16 @@ Respond ONLY with the JSON object, no other text."""
                     total_chunks = chunk_info.get('total_chunks', 1)
                     chunk_note = f"\n[NOTE: This is chunk {chunk_idx + 1} of {total_chunks} from this document - data may be incomplete]"
                 
-                context_parts.append(f"""
-[Source: "{title}" from {collection_name}]{chunk_note}
-Content: {snippet}
-""")
+                if i:
+                    context_buf.write("\n")
+                context_buf.write(f'\n[Source: "{title}" from {collection_name}]{chunk_note}\nContent: ')
+                context_buf.write(snippet)
+                context_buf.write("\n")
                 
+                preview = snippet[:200]
                 sources.append({
                     'title': title,
-                    'content': snippet[:200] + "..." if len(snippet) > 200 else snippet,
+                    'content': preview + "..." if len(preview) < len(snippet) else preview,
                     'score': result.get('score', 0),
                     'collection': collection_name,
                     'collection_location': result.get('collection_location', ''),
@@ -737,7 +941,7 @@ Content: {snippet}
                     'metadata': result.get('metadata', {})
                 })
             
-            context = "\n".join(context_parts)
+            context = context_buf.getvalue()
             
             # Create enhanced prompt for multi-collection
             prompt = f"""
@@ -783,17 +987,18 @@ Please provide your answer:
             # Filter sources to only include those actually cited in the answer
             cited_sources = []
             seen_titles = set()  # Track unique titles
+            answer_lower = answer_text.lower()
             
             for source in sources:
                 title = source['title']
                 # Check if this source is cited in the answer (case-insensitive)
-                if f'"{title}"' in answer_text or title.lower() in answer_text.lower():
+                if f'"{title}"' in answer_text or title.lower() in answer_lower:
                     # Only add if we haven't seen this title before
                     if title not in seen_titles:
                         cited_sources.append(source)
                         seen_titles.add(title)
             
-            print(f"\n  📄 Filtered sources: {len(cited_sources)}/{len(sources)} actually cited")
+            logger.info(f"\n  📄 Filtered sources: {len(cited_sources)}/{len(sources)} actually cited")
             
             return {
                 'answer': answer_text,
@@ -845,19 +1050,8 @@ class EnhancedRAGSystem:
                 raise ValueError("GOOGLE_API_KEY not set! Either set GOOGLE_API_KEY or use Vertex AI (set USE_VERTEX_AI=True)")
             genai.configure(api_key=api_key)
         
-        # Load embeddings based on config
-        print("Loading embeddings...")
-        if USE_VERTEX_EMBEDDINGS:
-            from vertex_embeddings import VertexEmbedder, VertexReranker
-            print("  🌐 Using Vertex AI Embeddings (production-grade)")
-            self.embedder = VertexEmbedder()
-            print("Loading re-ranking model...")
-            self.reranker = VertexReranker(self.embedder)
-        else:
-            print("  💻 Using Local Embeddings (development mode)")
-            self.embedder = LocalEmbedder()
-            print("Loading re-ranking model...")
-            self.reranker = LocalReranker()
+        # Embedder/reranker are shared by every collection in the process
+        self.embedder, self.reranker = _get_shared_embedding_models()
         
         print(f"Connecting to vector store: '{self.collection_name}'")
         self.vector_store = VectorStore(collection_name=self.collection_name)
@@ -899,8 +1093,8 @@ class EnhancedRAGSystem:
             "live_drive_search": self._tool_live_drive_search,
         }
         
-        stats = self.vector_store.get_stats()
-        print(f"[+] Agent Ready! {stats['total_documents']} documents indexed.\n")
+        # Reuse the count taken above rather than asking Chroma again via get_stats()
+        print(f"[+] Agent Ready! {doc_count} documents indexed.\n")
 
     # --- MODIFIED: Function now accepts classic 'tools' object ---
     def _initialize_model(self, system_instruction, tools):
@@ -952,22 +1146,13 @@ class EnhancedRAGSystem:
         Expand query with common variations to improve recall.
         Handles business/financial terminology.
         """
-        # Common expansions for business terms
-        expansions = {
-            r'\bmarkets?\b': 'markets regions territories areas',
-            r'\bprojects?\b': 'projects initiatives campaigns programs',
-            r'\breports?\b': 'reports summaries analyses documents',
-            r'\bsales?\b': 'sales revenue earnings income',
-            r'\bbudgets?\b': 'budgets forecasts projections estimates',
-            r'\bclients?\b': 'clients customers accounts',
-        }
-        
-        expanded = query.lower()
-        for pattern, replacement in expansions.items():
-            expanded = re.sub(pattern, replacement, expanded, flags=re.IGNORECASE)
+        query_lower = query.lower()
+        expanded = query_lower
+        for pattern, replacement in QUERY_EXPANSIONS:
+            expanded = pattern.sub(replacement, expanded)
         
         # If query didn't change much, just return original
-        if expanded == query.lower():
+        if expanded == query_lower:
             return query
         
         # Combine original + expanded for best results
@@ -978,29 +1163,20 @@ class EnhancedRAGSystem:
         Detect if query requires synthesis across multiple documents.
         Uses confidence threshold to be more selective about multi-query mode.
         """
-        synthesis_indicators = {
-            # Strong indicators (weight: 1.0)
-            'summarize': 1.0, 'summary': 1.0, 'summaries': 1.0,
-            'compare': 1.0, 'comparison': 1.0, 'versus': 1.0, 'vs': 1.0,
-            'list all': 1.0, 'show all': 1.0, 'tell me about all': 1.0,
-            'all reports': 1.0, 'all markets': 1.0, 'all projects': 1.0,
-            
-            # Moderate indicators (weight: 0.6)
-            'differences': 0.6, 'similarities': 0.6,
-            'across': 0.6, 'between': 0.6,
-            'overview': 0.6, 'aggregate': 0.6,
-            
-            # Weak indicators (weight: 0.3)
-            'all': 0.3, 'every': 0.3, 'each': 0.3,
-        }
-        
         query_lower = query.lower()
+        # Tokenize once; single-word indicators become set lookups and only
+        # the few multi-word phrases need a substring scan
+        query_tokens = set(re.findall(r'\w+', query_lower))
         
         # Calculate confidence score
         confidence = 0.0
         matched_indicators = []
         
-        for indicator, weight in synthesis_indicators.items():
+        for indicator, weight in SYNTHESIS_WORD_INDICATORS.items():
+            if indicator in query_tokens:
+                confidence += weight
+                matched_indicators.append(indicator)
+        for indicator, weight in SYNTHESIS_PHRASE_INDICATORS.items():
             if indicator in query_lower:
                 confidence += weight
                 matched_indicators.append(indicator)
@@ -1107,6 +1283,14 @@ class EnhancedRAGSystem:
         Args:
             query: The specific, detailed query to search for.
         """
+        return _json_dumps(self._tool_rag_search_raw(query))
+    
+    def _tool_rag_search_raw(self, query: str):
+        """
+        Run the rag_search pipeline and return native Python objects: a list of
+        snippet dicts, or a dict with an "error"/"status" key. In-process callers
+        use this directly; _tool_rag_search wraps it in JSON for the model.
+        """
         safe_print(f"  🤖 Agent Action: rag_search(query=\"{query}\")")
         
         # Check if this is a synthesis query
@@ -1127,27 +1311,22 @@ class EnhancedRAGSystem:
         all_metadatas = []
         all_scores = []
         
-        for query_variant in queries:
-            # 1. Query Expansion - Improve recall with synonyms
-            expanded_query = self._expand_query(query_variant)
-            
-            # 2. Embed the expanded query
-            query_embedding = self.embedder.embed_query(expanded_query)
-            
-            # 3. Vector Search (Dense Semantic Search)
-            # Apply file_id filter if specified for targeted queries
-            where_filter = None
-            if hasattr(self, '_target_file_id') and self._target_file_id:
-                where_filter = {"file_id": self._target_file_id}
-                safe_print(f"  🎯 Filtering to specific file: {self._target_file_id}")
-            
-            results = self.vector_store.search(query_embedding, n_results=INITIAL_RETRIEVAL_COUNT, where=where_filter)
-            
-            if not results['documents'] or not results['documents'][0]:
-                continue
-            
-            # 4. Extract contexts and metadata
-            for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
+        # 1. Query Expansion - Improve recall with synonyms
+        # 2. Embed each expanded query variation
+        query_embeddings = [self.embedder.embed_query(self._expand_query(q)) for q in queries]
+        
+        # 3. Vector Search (Dense Semantic Search) - all variations in one query
+        # Apply file_id filter if specified for targeted queries
+        where_filter = None
+        if hasattr(self, '_target_file_id') and self._target_file_id:
+            where_filter = {"file_id": self._target_file_id}
+            safe_print(f"  🎯 Filtering to specific file: {self._target_file_id}")
+        
+        results = self.vector_store.search_batch(query_embeddings, n_results=INITIAL_RETRIEVAL_COUNT, where=where_filter)
+        
+        # 4. Extract contexts and metadata
+        for docs, metadatas in zip(results['documents'] or [], results['metadatas'] or []):
+            for doc, metadata in zip(docs, metadatas):
                 # Avoid duplicates from multiple queries
                 if doc not in all_contexts:
                     all_contexts.append(doc)
@@ -1156,17 +1335,17 @@ class EnhancedRAGSystem:
         if not all_contexts:
             doc_count = self.vector_store.collection.count()
             if doc_count == 0:
-                return json.dumps({
+                return {
                     "error": f"Collection '{self.collection_name}' is empty (0 documents). Please index documents first.",
                     "collection": self.collection_name,
                     "document_count": 0
-                })
+                }
             else:
-                return json.dumps({
+                return {
                     "error": f"No relevant documents found for your query in collection '{self.collection_name}' ({doc_count} documents indexed).",
                     "collection": self.collection_name,
                     "document_count": doc_count
-                })
+                }
         
         safe_print(f"  📊 Multi-query search: {len(all_contexts)} unique documents retrieved")
         
@@ -1190,6 +1369,22 @@ class EnhancedRAGSystem:
             initial_doc_count = len(all_contexts)
             chunks_added = 0
             
+            # Fetch all chunks for every CSV file in one query, then split per file
+            chunks_by_file = defaultdict(list)
+            try:
+                file_ids = list(csv_files_found)
+                all_docs = self.vector_store.collection.get(
+                    where={"file_id": file_ids[0]} if len(file_ids) == 1 else {"file_id": {"$in": file_ids}},
+                    include=["documents", "metadatas"]
+                )
+                for doc, metadata in zip(all_docs.get('documents') or [], all_docs.get('metadatas') or []):
+                    chunks_by_file[metadata.get('file_id')].append((doc, metadata))
+            except Exception as e:
+                print(f"        ❌ Error fetching CSV chunks: {e}")
+                import traceback
+                traceback.print_exc()
+            
+            seen_contexts = set(all_contexts)
             for file_id, info in csv_files_found.items():
                 file_display = info['file_name']
                 if info['file_path']:
@@ -1198,36 +1393,27 @@ class EnhancedRAGSystem:
                 print(f"     📄 {file_display}")
                 print(f"        Expected chunks: {info['total_chunks']}")
                 
-                # Fetch all chunks for this CSV file
-                try:
-                    all_docs = self.vector_store.collection.get(
-                        where={"file_id": file_id}
-                    )
+                file_chunks = chunks_by_file.get(file_id)
+                if file_chunks:
+                    chunks_retrieved = len(file_chunks)
+                    chunks_added_for_file = 0
                     
-                    if all_docs and all_docs.get('documents'):
-                        chunks_retrieved = len(all_docs['documents'])
-                        chunks_added_for_file = 0
-                        
-                        for doc, metadata in zip(all_docs['documents'], all_docs['metadatas']):
-                            if doc not in all_contexts:
-                                all_contexts.append(doc)
-                                all_metadatas.append(metadata)
-                                chunks_added_for_file += 1
-                        
-                        chunks_added += chunks_added_for_file
-                        print(f"        ✓ Retrieved: {chunks_retrieved} chunks")
-                        print(f"        ✓ Added to context: {chunks_added_for_file} new chunks")
-                        
-                        # Warning if chunk count doesn't match expected
-                        if chunks_retrieved != info['total_chunks']:
-                            print(f"        ⚠️  Warning: Expected {info['total_chunks']} chunks but found {chunks_retrieved}")
-                    else:
-                        print(f"        ⚠️  No chunks found for file_id: {file_id}")
-                        
-                except Exception as e:
-                    print(f"        ❌ Error fetching CSV chunks: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    for doc, metadata in file_chunks:
+                        if doc not in seen_contexts:
+                            seen_contexts.add(doc)
+                            all_contexts.append(doc)
+                            all_metadatas.append(metadata)
+                            chunks_added_for_file += 1
+                    
+                    chunks_added += chunks_added_for_file
+                    print(f"        ✓ Retrieved: {chunks_retrieved} chunks")
+                    print(f"        ✓ Added to context: {chunks_added_for_file} new chunks")
+                    
+                    # Warning if chunk count doesn't match expected
+                    if chunks_retrieved != info['total_chunks']:
+                        print(f"        ⚠️  Warning: Expected {info['total_chunks']} chunks but found {chunks_retrieved}")
+                else:
+                    print(f"        ⚠️  No chunks found for file_id: {file_id}")
             
             final_doc_count = len(all_contexts)
             print(f"  📊 CSV auto-fetch complete:")
@@ -1247,41 +1433,41 @@ class EnhancedRAGSystem:
             # Build/update BM25 index with current contexts
             self.hybrid_searcher.update_corpus(contexts)
             
-            # Get BM25 scores
+            # Get BM25 scores as a dense per-context vector
             bm25_results = self.hybrid_searcher.search(query, top_k=len(contexts))
-            bm25_scores = {idx: score for idx, score in bm25_results}
+            bm25_scores = np.zeros(len(contexts), dtype=np.float32)
+            for idx, score in bm25_results:
+                bm25_scores[idx] = score
             
             # Normalize scores to 0-1 range
-            max_bm25 = max(bm25_scores.values()) if bm25_scores else 1.0
+            max_bm25 = float(bm25_scores.max()) if bm25_results else 1.0
             # Handle case where max_bm25 is 0 (all scores are 0)
             if max_bm25 == 0:
                 max_bm25 = 1.0
-            normalized_bm25 = {idx: score/max_bm25 for idx, score in bm25_scores.items()}
+            normalized_bm25 = bm25_scores / max_bm25
             
             # For multi-query, we don't have dense scores, so weight BM25 more
             if len(queries) > 1:
                 # Re-sort by BM25 scores only
-                sorted_indices = sorted(range(len(contexts)), key=lambda x: normalized_bm25.get(x, 0), reverse=True)
+                sorted_indices = np.argsort(-normalized_bm25, kind='stable')
                 contexts = [contexts[i] for i in sorted_indices]
                 metadatas = [metadatas[i] for i in sorted_indices]
                 print(f"  🔀 Multi-query mode: Using BM25 ranking")
             else:
                 # Single query: use full hybrid search
-                dense_scores = results.get('distances', [[]])[0]
-                max_dist = max(dense_scores) if dense_scores else 1.0
+                dense_scores = np.asarray(results.get('distances', [[]])[0], dtype=np.float32)
+                max_dist = float(dense_scores.max()) if dense_scores.size else 1.0
                 # Handle case where max_dist is 0 (all distances are 0)
                 if max_dist == 0:
                     max_dist = 1.0
-                normalized_dense = {idx: 1 - (dist/max_dist) for idx, dist in enumerate(dense_scores)}
+                dense_scores = dense_scores[:len(contexts)]
+                normalized_dense = np.zeros(len(contexts), dtype=np.float32)
+                normalized_dense[:dense_scores.size] = 1 - (dense_scores / max_dist)
                 
-                # Combine scores with weights
-                hybrid_scores = {}
-                for idx in range(len(contexts)):
-                    bm25_score = normalized_bm25.get(idx, 0)
-                    dense_score = normalized_dense.get(idx, 0)
-                    hybrid_scores[idx] = (BM25_WEIGHT * bm25_score) + (DENSE_WEIGHT * dense_score)
+                # Combine scores with weights in one vectorized pass
+                hybrid_scores = (BM25_WEIGHT * normalized_bm25) + (DENSE_WEIGHT * normalized_dense)
                 
-                sorted_indices = sorted(hybrid_scores.keys(), key=lambda x: hybrid_scores[x], reverse=True)
+                sorted_indices = np.argsort(-hybrid_scores, kind='stable')
                 contexts = [contexts[i] for i in sorted_indices]
                 metadatas = [metadatas[i] for i in sorted_indices]
                 print(f"  🔀 Hybrid search: BM25 ({BM25_WEIGHT}) + Dense ({DENSE_WEIGHT})")
@@ -1305,7 +1491,7 @@ class EnhancedRAGSystem:
         
         # 8. Format Output for AI (Precise Snippets)
         output_snippets = []
-        file_counts = {}  # Track chunks per file for diversity
+        file_counts = defaultdict(int)  # Track chunks per file for diversity
         unique_files = set()  # Track unique source files
         
         for item in reranked_results:
@@ -1321,8 +1507,6 @@ class EnhancedRAGSystem:
 
             # Diversity: Limit chunks from same file
             file_name = metadata.get('file_name') or metadata.get('filename', 'unknown')
-            if file_name not in file_counts:
-                file_counts[file_name] = 0
             
             # Skip if we already have MAX_CHUNKS_PER_FILE chunks from this file
             if file_counts[file_name] >= MAX_CHUNKS_PER_FILE:
@@ -1377,9 +1561,9 @@ class EnhancedRAGSystem:
         print(f"  ✅ Returning {len(unique_snippets)} unique results from {len(unique_files)} files")
         
         if not unique_snippets:
-            return json.dumps({"status": "No relevant documents found after filtering."})
+            return {"status": "No relevant documents found after filtering."}
             
-        return json.dumps(unique_snippets)
+        return unique_snippets
 
     def _tool_search_folder(self, folder_pattern: str, query: str = ""):
         """
@@ -1392,34 +1576,33 @@ class EnhancedRAGSystem:
         """
         safe_print(f"  🤖 Agent Action: search_folder(folder=\"{folder_pattern}\", query=\"{query}\")")
         
-        # Get all documents from the collection with their metadata
+        # Filter documents by folder pattern, scanning metadata a page at a
+        # time - chunk text is fetched later, and only for matches
+        folder_pattern_lower = folder_pattern.lower()
+        matching_ids = []
+        matching_metadatas = []
+        scanned = 0
+        
         try:
-            all_results = self.vector_store.collection.get(
-                include=["metadatas", "documents"]
-            )
+            for page_ids, page_metadatas in self.vector_store.iter_metadata_pages():
+                scanned += len(page_ids)
+                for doc_id, metadata in zip(page_ids, page_metadatas):
+                    # Check if folder pattern appears in file_path or folder_name
+                    file_path = metadata.get('file_path', '').lower()
+                    folder_name = metadata.get('folder_name', '').lower()
+                    
+                    if folder_pattern_lower in file_path or folder_pattern_lower in folder_name:
+                        matching_ids.append(doc_id)
+                        matching_metadatas.append(metadata)
         except Exception as e:
             return json.dumps({"error": f"Could not fetch documents: {str(e)}"})
         
-        if not all_results or not all_results.get('metadatas'):
+        if not scanned:
             return json.dumps({"error": "No documents found in database."})
         
-        # Filter documents by folder pattern
-        folder_pattern_lower = folder_pattern.lower()
-        matching_docs = []
-        matching_metadatas = []
-        
-        for doc, metadata in zip(all_results['documents'], all_results['metadatas']):
-            # Check if folder pattern appears in file_path or folder_name
-            file_path = metadata.get('file_path', '').lower()
-            folder_name = metadata.get('folder_name', '').lower()
-            
-            if folder_pattern_lower in file_path or folder_pattern_lower in folder_name:
-                matching_docs.append(doc)
-                matching_metadatas.append(metadata)
-        
-        print(f"  📁 Found {len(matching_docs)} documents in folder matching '{folder_pattern}'")
+        print(f"  📁 Found {len(matching_ids)} documents in folder matching '{folder_pattern}'")
         
-        if not matching_docs:
+        if not matching_ids:
             return json.dumps({
                 "status": f"No documents found in folder '{folder_pattern}'.",
                 "suggestion": "Try a different folder name or check the folder structure."
@@ -1434,12 +1617,26 @@ class EnhancedRAGSystem:
             # Embed query
             query_embedding = self.embedder.embed_query(expanded_query)
             
+            # Fetch the text of the matching chunks only
+            try:
+                matched = self.vector_store.collection.get(
+                    ids=matching_ids,
+                    include=["documents", "metadatas"]
+                )
+            except Exception as e:
+                return json.dumps({"error": f"Could not fetch documents: {str(e)}"})
+            matching_docs = matched['documents']
+            matching_metadatas = matched['metadatas']
+            
             # Search only within the filtered documents
-            # We'll rerank the filtered docs by the query
-            reranked = self.reranker.rerank(query, matching_docs)
+            # We'll rerank the filtered docs by the query, keeping the top results
+            top_results = self.reranker.rerank(query, matching_docs, top_k=TOP_K_RESULTS)
             
-            # Take top results
-            top_results = reranked[:min(TOP_K_RESULTS, len(reranked))]
+            # Map each chunk's text to its first position once, instead of
+            # scanning the folder's chunk list for every top result
+            doc_positions = {}
+            for position, doc in enumerate(matching_docs):
+                doc_positions.setdefault(doc, position)
             
             # Build output
             output_snippets = []
@@ -1447,11 +1644,10 @@ class EnhancedRAGSystem:
                 context_text = item['context']
                 
                 # Find original metadata
-                try:
-                    original_index = matching_docs.index(context_text)
-                    metadata = matching_metadatas[original_index]
-                except ValueError:
+                original_index = doc_positions.get(context_text)
+                if original_index is None:
                     continue
+                metadata = matching_metadatas[original_index]
                 
                 # Format file information with Google Drive link
                 file_info = self._format_file_info(metadata)
@@ -1555,7 +1751,7 @@ class EnhancedRAGSystem:
 
     # --- The NEW Agent Executor Loop ---
     
-    def search_documents(self, question, top_k=10, file_id=None):
+    def search_documents(self, question, top_k=10, file_id=None, extra_fields=None):
         """
         Search for relevant documents and return structured results.
         This method is used by MultiCollectionRAGSystem.
@@ -1564,6 +1760,7 @@ class EnhancedRAGSystem:
             question: The search query
             top_k: Number of top results to return
             file_id: Optional file ID to filter results
+            extra_fields: Optional dict merged into every result (e.g. collection tags)
             
         Returns:
             List of dicts with keys: title, content, url, score
@@ -1571,27 +1768,24 @@ class EnhancedRAGSystem:
         # Store file_id for tool calls
         self._target_file_id = file_id
         try:
-            # Use the RAG search tool to get documents
-            context_json = self._tool_rag_search(question)
-            
-            # Parse the JSON - _tool_rag_search returns a list of snippets directly
-            snippets = json.loads(context_json)
+            # Use the RAG search pipeline directly - no JSON round-trip in-process
+            snippets = self._tool_rag_search_raw(question)
             
             # Handle error response (dict with "error" or "status" key)
             if isinstance(snippets, dict):
                 if "error" in snippets:
-                    print(f"  ⚠️  RAG search returned error: {snippets.get('error')}")
+                    logger.warning(f"  ⚠️  RAG search returned error: {snippets.get('error')}")
                     return []
                 if "status" in snippets:
-                    print(f"  ⚠️  RAG search status: {snippets.get('status')}")
+                    logger.warning(f"  ⚠️  RAG search status: {snippets.get('status')}")
                     return []
             
             # snippets should be a list of dicts with keys: source_path, snippet, relevance, chunk_index, file_info
             if not isinstance(snippets, list) or not snippets:
-                print(f"  ⚠️  No snippets found in search results")
+                logger.warning(f"  ⚠️  No snippets found in search results")
                 return []
             
-            print(f"  ✓ Found {len(snippets)} snippets from _tool_rag_search")
+            logger.info(f"  ✓ Found {len(snippets)} snippets from _tool_rag_search_raw")
             
             # Convert snippets to the format expected by MultiCollectionRAGSystem
             results = []
@@ -1599,7 +1793,7 @@ class EnhancedRAGSystem:
                 # Extract file info from the file_info dict
                 file_info = snippet.get('file_info', {})
                 
-                # Parse relevance score - should be a float from _tool_rag_search
+                # Parse relevance score - should be a float from _tool_rag_search_raw
                 relevance = snippet.get('relevance', 0.0)
                 try:
                     score = float(relevance)
@@ -1619,13 +1813,15 @@ class EnhancedRAGSystem:
                         'file_id': file_info.get('file_id', '')
                     }
                 }
+                if extra_fields:
+                    result.update(extra_fields)
                 results.append(result)
             
-            print(f"  ✓ Returning {len(results)} formatted results")
+            logger.info(f"  ✓ Returning {len(results)} formatted results")
             return results
             
         except Exception as e:
-            print(f"  ⚠️  Error in search_documents: {e}")
+            logger.warning(f"  ⚠️  Error in search_documents: {e}")
             import traceback
             traceback.print_exc()
             return []
@@ -1963,7 +2159,7 @@ def load_indexed_folders():
     """Helper to load the folder log (unchanged)"""
     if os.path.exists(INDEXED_FOLDERS_FILE):
         # --- ✅ FINAL FIX: Removed the extra '.' ---
-        with open(INDEXED_FOLDERS_FILE, 'r') as f:
+        with open(INDEXED_FOLDERS_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
     return {}
 
@@ -1976,6 +2172,7 @@ def interactive_mode(collection_name, collection_display_name):
     print(f"(Collection: {collection_name})")
     print("=" * 80)
     print("\nInitializing...")
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     
     try:
         drive_service = authenticate_google_drive()
@@ -10,9 +10,13 @@ except ImportError:
     pass
 
 import chromadb
+from chromadb.api.client import SharedSystemClient
 from config import CHROMA_PERSIST_DIR, COLLECTION_NAME
 import os
+import sqlite3
 import sys
+import threading
+import time
 
 # Fix Windows console encoding for Unicode characters
 if os.name == 'nt':  # Windows
@@ -22,21 +26,50 @@ if os.name == 'nt':  # Windows
     except (AttributeError, OSError):
         pass
 
+_EMOJI_FALLBACK = str.maketrans({'📊': '[STATS]'})
+
 def safe_print(*args, **kwargs):
     """Safe print function that handles Unicode encoding errors on Windows"""
     try:
         print(*args, **kwargs)
     except UnicodeEncodeError:
-        safe_args = []
-        for arg in args:
-            if isinstance(arg, str):
-                safe_arg = arg.replace('📊', '[STATS]')
-                safe_args.append(safe_arg)
-            else:
-                safe_args.append(str(arg))
+        safe_args = [arg.translate(_EMOJI_FALLBACK) if isinstance(arg, str) else str(arg) for arg in args]
         print(*safe_args, **kwargs)
 
 
+# Index settings for every collection (only applied when a collection is created)
+COLLECTION_METADATA = {"hnsw:space": "cosine"}
+
+# One PersistentClient per directory: each client opens its own SQLite
+# connections and loads segment state, so VectorStores share them
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(persist_directory=CHROMA_PERSIST_DIR):
+    """Return the shared ChromaDB client for persist_directory"""
+    with _clients_lock:
+        client = _clients.get(persist_directory)
+        if client is None:
+            os.makedirs(persist_directory, exist_ok=True)
+            client = _clients[persist_directory] = chromadb.PersistentClient(path=persist_directory)
+        return client
+
+
+def release_clients():
+    """Stop and drop the shared clients, e.g. before deleting the database directory"""
+    with _clients_lock:
+        for client in _clients.values():
+            try:
+                client._system.stop()
+            except Exception as e:
+                print(f"  Warning: could not stop ChromaDB client: {e}")
+        _clients.clear()
+        # PersistentClient caches one System per path for the whole process;
+        # without this the next client would reuse the old SQLite handles
+        SharedSystemClient.clear_system_cache()
+
+
 class VectorStore:
     """ChromaDB - Manages vector database collections"""
     
@@ -48,40 +81,95 @@ class VectorStore:
         """
         print(f"Initializing vector database client at {persist_directory}...")
         
-        os.makedirs(persist_directory, exist_ok=True)
-        
-        # This client is shared for all collections
-        self.client = chromadb.PersistentClient(path=persist_directory)
+        # This client is shared for all collections (and VectorStores)
+        self.client = get_client(persist_directory)
         
         print(f"Getting or creating collection: '{collection_name}'")
         self.collection_name = collection_name
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.collection = self._open_collection()
         
         count = self.collection.count()
+        # Reused by search() to bound n_results; None means "recount"
+        self._cached_count = count
         print(f"[+] Collection '{self.collection_name}' ready. Documents: {count}")
     
+    def _open_collection(self):
+        """Get or create THIS collection with the shared index settings"""
+        return self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata=COLLECTION_METADATA
+        )
+    
     def add_documents(self, documents, embeddings, metadatas, ids):
         """Add or update documents in the collection - auto-persists"""
         try:
-            if hasattr(embeddings, 'tolist'):
-                embeddings = embeddings.tolist()
+            # numpy embeddings stay a contiguous array; only the slice being
+            # upserted is converted to Python lists at the Chroma boundary
+            is_array = hasattr(embeddings, 'tolist')
+
+            # Chroma rejects a batch that repeats an id; keep the last occurrence
+            if len(set(ids)) != len(ids):
+                keep = sorted({doc_id: i for i, doc_id in enumerate(ids)}.values())
+                print(f"  Dropping {len(ids) - len(keep)} duplicate id(s) from batch")
+                documents = [documents[i] for i in keep]
+                embeddings = embeddings[keep] if is_array else [embeddings[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+                ids = [ids[i] for i in keep]
+
+            # Chroma stores metadata as typed columns and rejects None values
+            # (e.g. a Drive file without modifiedTime), so drop them up front
+            # rather than losing the whole batch
+            metadatas = [
+                {k: v for k, v in m.items() if v is not None} if None in m.values() else m
+                for m in metadatas
+            ]
 
             batch_size = 4000
-            for i in range(0, len(ids), batch_size):
-                print(f"  Upserting batch {i//batch_size + 1} to '{self.collection_name}'...")
-                self.collection.upsert(
-                    documents=documents[i:i + batch_size],
-                    embeddings=embeddings[i:i + batch_size],
-                    metadatas=metadatas[i:i + batch_size],
-                    ids=ids[i:i + batch_size]
+            total = len(ids)
+            if not total:
+                return
+            if total <= batch_size:
+                # Single batch (the usual case) - hand the lists over without copying
+                self._upsert_batch(
+                    documents,
+                    embeddings.tolist() if is_array else embeddings,
+                    metadatas,
+                    ids
                 )
+            else:
+                # One line per call; indexers already report their own progress
+                print(f"  Upserting {total} documents to '{self.collection_name}' in {-(-total // batch_size)} batches...")
+                for i in range(0, total, batch_size):
+                    batch_embeddings = embeddings[i:i + batch_size]
+                    self._upsert_batch(
+                        documents[i:i + batch_size],
+                        batch_embeddings.tolist() if is_array else batch_embeddings,
+                        metadatas[i:i + batch_size],
+                        ids[i:i + batch_size]
+                    )
+            # Upserts may add or replace, so recount on the next search
+            self._cached_count = None
         except Exception as e:
+            self._cached_count = None
             print(f"  Error adding documents: {e}")
             raise
     
+    def _upsert_batch(self, documents, embeddings, metadatas, ids):
+        """Upsert one batch, retrying once if another writer holds the SQLite lock"""
+        try:
+            self.collection.upsert(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
+            return
+        except sqlite3.OperationalError as e:
+            # Only lock contention (e.g. a concurrent indexer) is worth retrying
+            if 'locked' not in str(e):
+                raise
+            print(f"  Database busy, retrying batch of {len(ids)}...")
+        time.sleep(1)
+        try:
+            self.collection.upsert(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
+        except Exception as e:
+            raise RuntimeError(f"Upsert of {len(ids)} documents ({ids[0]} .. {ids[-1]}) failed: {e}") from e
+    
     def search(self, query_embedding, n_results=5, where=None):
         """Search for similar documents in this collection
         
@@ -90,25 +178,54 @@ class VectorStore:
             n_results: Number of results to return
             where: Optional ChromaDB where filter (dict) to filter results
         """
+        if hasattr(query_embedding, 'tolist'):
+            query_embedding = query_embedding.tolist()
+        return self.search_batch([query_embedding], n_results=n_results, where=where)
+    
+    def search_batch(self, query_embeddings, n_results=5, where=None):
+        """Search for several query embeddings in one ChromaDB call
+        
+        Args:
+            query_embeddings: Sequence (or 2-D numpy array) of query embedding vectors
+            n_results: Number of results to return per query
+            where: Optional ChromaDB where filter (dict) applied to every query
+        
+        Returns:
+            ChromaDB result dict with one row per query in 'documents', 'metadatas' and 'distances'
+        """
+        if hasattr(query_embeddings, 'tolist'):
+            query_embeddings = query_embeddings.tolist()
+        else:
+            query_embeddings = [q.tolist() if hasattr(q, 'tolist') else q for q in query_embeddings]
+        
+        def empty_results():
+            return {
+                'documents': [[] for _ in query_embeddings],
+                'metadatas': [[] for _ in query_embeddings],
+                'distances': [[] for _ in query_embeddings]
+            }
+        
         try:
-            count = self.collection.count()
+            # The cached count only short-circuits empty collections; another
+            # VectorStore may have written since, so it never caps n_results
+            # (Chroma clamps n_results to the collection size itself).
+            # An empty cached count is re-checked so a store opened before
+            # indexing (e.g. by the chat API) picks up new documents
+            count = self._cached_count
+            if not count:
+                count = self._cached_count = self.collection.count()
             
             if count == 0:
                 print(f"[!] Collection '{self.collection_name}' is empty.")
-                return {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
-            
-            actual_n_results = min(n_results, count)
-            
-            if actual_n_results <= 0:
-                return {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+                return empty_results()
             
-            if hasattr(query_embedding, 'tolist'):
-                query_embedding = query_embedding.tolist()
+            if n_results <= 0 or not query_embeddings:
+                return empty_results()
             
             # Build query parameters
             query_params = {
-                'query_embeddings': [query_embedding],
-                'n_results': actual_n_results
+                'query_embeddings': query_embeddings,
+                'n_results': n_results
             }
             
             # Add where filter if provided
@@ -122,29 +239,43 @@ class VectorStore:
             
         except Exception as e:
             print(f"  Error searching: {e}")
-            return {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+            return empty_results()
 
     def clear_collection(self):
         """Clear all documents from THIS collection."""
         try:
             print(f"Clearing all documents from collection '{self.collection_name}'...")
             self.client.delete_collection(name=self.collection_name)
-            self.collection = self.client.get_or_create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
+            self.collection = self._open_collection()
+            self._cached_count = 0
             print("✓ Collection cleared.")
         except Exception as e:
+            self._cached_count = None
             print(f"Error clearing collection: {e}")
             # Try to re-create just in case
             try:
-                 self.collection = self.client.get_or_create_collection(
-                    name=self.collection_name,
-                    metadata={"hnsw:space": "cosine"}
-                )
+                self.collection = self._open_collection()
             except Exception as e2:
                 print(f"Fatal error re-creating collection: {e2}")
 
+    def iter_metadata_pages(self, page_size=5000, where=None):
+        """Yield (ids, metadatas) pages of THIS collection without loading it all at once"""
+        offset = 0
+        while True:
+            page = self.collection.get(
+                where=where,
+                include=['metadatas'],
+                limit=page_size,
+                offset=offset
+            )
+            ids = page.get('ids') or []
+            if not ids:
+                return
+            yield ids, page['metadatas']
+            if len(ids) < page_size:
+                return
+            offset += page_size
+
     def get_stats(self):
         """Get statistics for THIS collection"""
         return {
@@ -179,6 +310,16 @@ class VectorStore:
             print(f"Error deleting collection '{collection_name}': {e}")
 
 
+def collection_exists(collection_name, persist_directory=CHROMA_PERSIST_DIR):
+    """Check for a collection by name without creating it or listing every collection"""
+    client = get_client(persist_directory)
+    try:
+        client.get_collection(name=collection_name)
+        return True
+    except Exception:
+        return False
+
+
 def get_collection_info():
     """Get basic collection information for health checks"""
     try:
@@ -1,8 +1,14 @@
 # vertex_embeddings.py - Vertex AI embeddings for scalable production use
 
+import queue
+import re
+import threading
+import time
 import vertexai
 from vertexai.language_models import TextEmbeddingModel, TextEmbeddingInput
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from typing import List, Optional
 from config import PROJECT_ID, LOCATION, ENABLE_EMBEDDING_CACHE, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_TTL_DAYS
 try:
@@ -12,6 +18,77 @@ except ImportError:
     TIKTOKEN_AVAILABLE = False
     print("WARNING: tiktoken not available, using character count approximation for token counting")
 
+# Sentence boundaries for compress_context
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r'[.!?]+')
+
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize a vector, or each row of a matrix, in place (zero rows stay zero)."""
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    embeddings /= norms.clip(min=1e-12)
+    return embeddings
+
+
+class QueryBatcher:
+    """
+    Coalesces query embeddings requested by concurrent callers into shared
+    Vertex AI requests. A daemon thread takes the first queued query, keeps
+    collecting for up to max_wait seconds (or until max_batch queries), then
+    embeds the whole window with one call and resolves each caller's future.
+    """
+    
+    def __init__(self, embed_fn, max_batch: int = 64, max_wait: float = 0.02):
+        """
+        Args:
+            embed_fn: Callable taking a list of query texts and returning one
+                vector per text, in order
+            max_batch: Most queries sent in one request
+            max_wait: Longest a query waits for others to join its request
+        """
+        self._embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+    
+    def submit(self, query: str) -> Future:
+        """Queue a query; the returned future resolves to its embedding values."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="vertex-query-batcher", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((query, future))
+        return future
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            # Anything that goes wrong with this window fails its callers but
+            # never the thread - otherwise every later submit() would hang
+            try:
+                # The same query asked twice in one window is embedded once
+                unique_queries = list(dict.fromkeys(query for query, _ in batch))
+                values = dict(zip(unique_queries, self._embed_fn(unique_queries)))
+                for query, future in batch:
+                    future.set_result(values[query])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
 
 class VertexEmbedder:
     """
@@ -25,6 +102,9 @@ class VertexEmbedder:
     - Cost: ~$0.00002 per 1K characters (~$0.30/month for 100 users)
     """
     
+    QUERY_LRU_MAX_SIZE = 512
+    QUERY_TIMEOUT = 60  # seconds embed_query waits on the batcher
+    
     def __init__(self, model_name: str = "text-embedding-004"):
         """
         Initialize Vertex AI embeddings.
@@ -43,6 +123,7 @@ class VertexEmbedder:
         # Token limits for Vertex AI embedding models
         self.max_tokens = 20000  # Vertex AI embedding model limit
         self.max_batch_tokens = 18000  # Leave some buffer
+        self.max_concurrent_batches = 4  # Parallel get_embeddings requests per embed_documents call
         
         # Initialize tokenizer for counting tokens (approximate)
         self.tokenizer = None
@@ -54,6 +135,13 @@ class VertexEmbedder:
         
         print(f"  ✓ Vertex AI Embeddings ready! Dimension: {self.dimension}")
         
+        # In-process LRU for embed_query, checked before the disk cache
+        self._query_lru = OrderedDict()
+        self._query_lru_lock = threading.Lock()
+        
+        # Uncached queries from concurrent requests share Vertex AI calls
+        self._query_batcher = QueryBatcher(self._embed_query_batch)
+        
         # Initialize embedding cache if enabled
         self.cache = None
         if ENABLE_EMBEDDING_CACHE:
@@ -82,20 +170,20 @@ class VertexEmbedder:
         current_tokens = 0
         
         for text in texts:
-            text_tokens = self.count_tokens(text)
+            # Encode once; the token list serves both the count and any truncation
+            tokens = self.tokenizer.encode(text) if self.tokenizer else None
+            text_tokens = len(tokens) if tokens is not None else len(text) // 4
             
             # If single text exceeds limit, truncate it
             if text_tokens > max_tokens:
-                if self.tokenizer:
+                if tokens is not None:
                     # Truncate to max_tokens
-                    tokens = self.tokenizer.encode(text)[:max_tokens]
-                    text = self.tokenizer.decode(tokens)
-                    text_tokens = max_tokens
+                    text = self.tokenizer.decode(tokens[:max_tokens])
                 else:
                     # Fallback: truncate by characters
                     text = text[:max_tokens * 4]
-                    text_tokens = max_tokens
-                print(f"  ✂️  Truncated text from {self.count_tokens(text)} to {text_tokens} tokens")
+                print(f"  ✂️  Truncated text from {text_tokens} to {max_tokens} tokens")
+                text_tokens = max_tokens
             
             # Check if adding this text would exceed the limit
             if current_tokens + text_tokens > max_tokens and current_batch:
@@ -111,6 +199,18 @@ class VertexEmbedder:
         
         return batches
     
+    def _embed_sub_batch(self, texts: List[str], task_type: str, query: Optional[str] = None) -> List[List[float]]:
+        """
+        Embed one request-sized batch (at most 250 texts) with a single Vertex AI call.
+        If query is given it is sent first, as RETRIEVAL_QUERY, and its vector is
+        the first element of the result.
+        """
+        inputs = [TextEmbeddingInput(text, task_type) for text in texts]
+        if query is not None:
+            inputs.insert(0, TextEmbeddingInput(query, "RETRIEVAL_QUERY"))
+        embeddings = self.model.get_embeddings(inputs)
+        return [emb.values for emb in embeddings]
+    
     def embed_documents(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
         """
         Generate embeddings for multiple documents.
@@ -127,74 +227,160 @@ class VertexEmbedder:
         Returns:
             numpy array of embeddings (shape: [len(texts), 768])
         """
+        return self._embed_documents(texts, task_type)[1]
+    
+    def embed_query_and_documents(self, query: str, texts: List[str],
+                                  task_type: str = "RETRIEVAL_DOCUMENT"):
+        """
+        Embed a query and a list of documents, sending the query in the same
+        Vertex AI request as the first document batch when it isn't cached.
+        
+        Returns:
+            (query embedding [768], document embeddings [len(texts), 768])
+        """
+        query_emb = self._lookup_query(query)
+        if query_emb is not None:
+            return query_emb, self.embed_documents(texts, task_type)
+        
+        query_emb, embeddings = self._embed_documents(texts, task_type, query=query)
+        if query_emb is None:
+            # Every document was cached (or the query didn't fit the first request)
+            query_emb = self.embed_query(query)
+        return query_emb, embeddings
+    
+    def _embed_documents(self, texts: List[str], task_type: str, query: Optional[str] = None):
+        """
+        Shared implementation of embed_documents. When query is given and a
+        request goes to Vertex AI anyway, the query rides along with the first
+        request; its embedding is returned (and cached), otherwise None.
+        
+        Returns:
+            (query embedding or None, document embeddings)
+        """
         if not texts:
-            return np.array([])
+            return None, np.array([])
         
-        # Try to get from cache first
-        cached_embeddings = []
-        uncached_texts = []
-        uncached_indices = []
+        # Output rows are filled in place: cache hits now, new embeddings below
+        all_embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        query_emb = None
         
+        # Try to get from cache first; hits come back as one matrix
         if self.cache:
-            for i, text in enumerate(texts):
-                cached = self.cache.get(text)
-                if cached is not None:
-                    cached_embeddings.append((i, cached))
-                else:
-                    uncached_texts.append(text)
-                    uncached_indices.append(i)
+            hit_indices, hit_embeddings = self.cache.get_matrix(texts, normalize=True)
+            if hit_indices:
+                all_embeddings[hit_indices] = hit_embeddings
+            hit_set = set(hit_indices)
+            uncached_indices = [i for i in range(len(texts)) if i not in hit_set]
+            uncached_texts = [texts[i] for i in uncached_indices]
         else:
             uncached_texts = texts
-            uncached_indices = list(range(len(texts)))
+            uncached_indices = slice(None)
         
         # Generate embeddings for uncached texts
-        new_embeddings = []
         if uncached_texts:
-            print(f"  🌐 Generating {len(uncached_texts)} embeddings via Vertex AI...")
+            # Send each distinct text once; repeats are filled from its row
+            unique_rows = {}
+            row_of = [unique_rows.setdefault(text, len(unique_rows)) for text in uncached_texts]
+            unique_texts = list(unique_rows)
+            
+            print(f"  🌐 Generating {len(unique_texts)} embeddings via Vertex AI...")
             
             # Split texts by token limits
-            token_batches = self.split_texts_by_tokens(uncached_texts, self.max_batch_tokens)
+            token_batches = self.split_texts_by_tokens(unique_texts, self.max_batch_tokens)
             print(f"  📦 Split into {len(token_batches)} token-limited batches")
             
-            for batch_idx, batch in enumerate(token_batches):
-                # Further split by count (Vertex AI supports up to 250 texts per request)
-                count_batch_size = 250
-                
+            # Further split by count (Vertex AI supports up to 250 texts per request),
+            # remembering where each request's rows start in unique_texts
+            count_batch_size = 250
+            jobs = []
+            offset = 0
+            for batch in token_batches:
                 for i in range(0, len(batch), count_batch_size):
-                    sub_batch = batch[i:i + count_batch_size]
-                    
-                    # Create TextEmbeddingInput objects with task type
-                    inputs = [TextEmbeddingInput(text, task_type) for text in sub_batch]
-                    
-                    # Get embeddings
-                    embeddings = self.model.get_embeddings(inputs)
-                    
-                    # Extract values
-                    batch_embeddings = [emb.values for emb in embeddings]
-                    new_embeddings.extend(batch_embeddings)
-                    
-                    if len(token_batches) > 1 or len(batch) > count_batch_size:
-                        print(f"    ✓ Processed batch {batch_idx + 1}/{len(token_batches)}, sub-batch {i//count_batch_size + 1}")
+                    jobs.append((offset + i, batch[i:i + count_batch_size], None))
+                offset += len(batch)
+            
+            # The query can share the first request if it fits in the count
+            # limit and the token headroom left by max_batch_tokens
+            if (query is not None and len(jobs[0][1]) < count_batch_size
+                    and self.count_tokens(query) <= self.max_tokens - self.max_batch_tokens):
+                jobs[0] = (jobs[0][0], jobs[0][1], query)
+            else:
+                query = None
+            
+            new_embeddings = np.empty((len(unique_texts), self.dimension), dtype=np.float32)
+            
+            def store(start, job_query, values):
+                nonlocal query_emb
+                if job_query is not None:
+                    query_emb = normalize_rows(np.asarray(values[0], dtype=np.float32))
+                    values = values[1:]
+                new_embeddings[start:start + len(values)] = values
+            
+            if len(jobs) == 1:
+                start, sub_batch, job_query = jobs[0]
+                store(start, job_query, self._embed_sub_batch(sub_batch, task_type, job_query))
+            else:
+                # Requests are network-bound, so run a few at a time and
+                # scatter each result back to its rows as it completes
+                workers = min(self.max_concurrent_batches, len(jobs))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {
+                        executor.submit(self._embed_sub_batch, sub_batch, task_type, job_query): (start, job_query)
+                        for start, sub_batch, job_query in jobs
+                    }
+                    for done, future in enumerate(as_completed(futures), 1):
+                        start, job_query = futures[future]
+                        store(start, job_query, future.result())
+                        print(f"    ✓ Processed sub-batch {done}/{len(jobs)}")
+            
+            # Store unit vectors so cosine similarity downstream is a plain dot product
+            new_embeddings = normalize_rows(new_embeddings)
+            
+            if len(unique_texts) == len(uncached_texts):
+                all_embeddings[uncached_indices] = new_embeddings
+            else:
+                all_embeddings[uncached_indices] = new_embeddings[row_of]
             
             # Cache the new embeddings
             if self.cache:
-                self.cache.set_batch(uncached_texts, new_embeddings)
-        
-        # Combine cached and new embeddings in original order
-        all_embeddings = [None] * len(texts)
-        
-        for i, emb in cached_embeddings:
-            all_embeddings[i] = emb
-        
-        for i, emb in zip(uncached_indices, new_embeddings):
-            all_embeddings[i] = emb
+                self.cache.set_batch(unique_texts, new_embeddings, normalized=True)
+            if query_emb is not None:
+                self._remember_query(query, query_emb, persist=True)
         
         # Show cache statistics
         if self.cache and len(texts) > 0:
             stats = self.cache.get_stats()
-            print(f"  📊 Cache: {len(cached_embeddings)}/{len(texts)} hits ({stats['hit_rate']}, {stats['total_entries']} total)")
+            print(f"  📊 Cache: {len(texts) - len(uncached_texts)}/{len(texts)} hits ({stats['hit_rate']}, {stats['total_entries']} total)")
         
-        return np.array(all_embeddings)
+        return query_emb, all_embeddings
+    
+    def _lookup_query(self, query: str) -> Optional[np.ndarray]:
+        """Return a cached query embedding from the in-process LRU or the disk cache, else None."""
+        # Recent queries are answered from memory; the reranker embeds the
+        # same query the search step just did
+        with self._query_lru_lock:
+            embedding = self._query_lru.get(query)
+            if embedding is not None:
+                self._query_lru.move_to_end(query)
+                return embedding
+        
+        # Then the disk cache
+        embedding = self.cache.get(query, normalize=True) if self.cache else None
+        if embedding is not None:
+            self._remember_query(query, embedding)
+        return embedding
+    
+    def _remember_query(self, query: str, embedding: np.ndarray, persist: bool = False):
+        """Add a query embedding to the in-process LRU (and the disk cache if persist)."""
+        if persist and self.cache:
+            self.cache.set(query, embedding, normalized=True)
+        
+        # Every caller gets this same array back, so nobody may modify it
+        embedding.setflags(write=False)
+        with self._query_lru_lock:
+            self._query_lru[query] = embedding
+            if len(self._query_lru) > self.QUERY_LRU_MAX_SIZE:
+                self._query_lru.popitem(last=False)
     
     def embed_query(self, query: str) -> np.ndarray:
         """
@@ -206,22 +392,20 @@ class VertexEmbedder:
         Returns:
             numpy array of embedding (shape: [768])
         """
-        # Check cache first
-        if self.cache:
-            cached = self.cache.get(query)
-            if cached is not None:
-                return np.array(cached)
-        
-        # Use RETRIEVAL_QUERY task type for queries
-        inputs = [TextEmbeddingInput(query, "RETRIEVAL_QUERY")]
-        embeddings = self.model.get_embeddings(inputs)
-        embedding = embeddings[0].values
-        
-        # Cache the result
-        if self.cache:
-            self.cache.set(query, embedding)
-        
-        return np.array(embedding)
+        embedding = self._lookup_query(query)
+        if embedding is None:
+            values = self._query_batcher.submit(query).result(timeout=self.QUERY_TIMEOUT)
+            embedding = normalize_rows(np.asarray(values, dtype=np.float32))
+            self._remember_query(query, embedding, persist=True)
+        return embedding
+    
+    def _embed_query_batch(self, queries: List[str]) -> List[List[float]]:
+        """Embed a window of queries for the QueryBatcher, one request per token-limited batch."""
+        values = []
+        for batch in self.split_texts_by_tokens(queries, self.max_batch_tokens):
+            # Use RETRIEVAL_QUERY task type for queries
+            values.extend(self._embed_sub_batch(batch, "RETRIEVAL_QUERY"))
+        return values
     
     def get_sentence_embedding_dimension(self) -> int:
         """Return embedding dimension for compatibility with LocalEmbedder"""
@@ -245,7 +429,7 @@ class VertexReranker:
         self.embedder = embedder or VertexEmbedder()
         print("  ✓ Vertex Reranker ready (using embedding similarity)")
     
-    def rerank(self, query: str, contexts: list, return_scores: bool = True):
+    def rerank(self, query: str, contexts: list, return_scores: bool = True, top_k: Optional[int] = None):
         """
         Rerank contexts using cosine similarity with embeddings
         
@@ -253,6 +437,7 @@ class VertexReranker:
             query: Search query
             contexts: List of text chunks to rerank
             return_scores: If True, include scores in results
+            top_k: If set, return only the top_k best contexts
         
         Returns:
             List of dicts with 'score' and 'context', sorted by relevance
@@ -262,7 +447,8 @@ class VertexReranker:
         
         # Limit contexts to prevent token overflow
         # Estimate tokens and truncate if necessary
-        total_estimated_tokens = sum(self.embedder.count_tokens(ctx) for ctx in contexts)
+        context_tokens = [self.embedder.count_tokens(ctx) for ctx in contexts]
+        total_estimated_tokens = sum(context_tokens)
         
         if total_estimated_tokens > self.embedder.max_batch_tokens:
             print(f"  ⚠️  Contexts too large ({total_estimated_tokens} tokens), limiting for reranking...")
@@ -271,8 +457,7 @@ class VertexReranker:
             limited_contexts = []
             token_count = 0
             
-            for ctx in contexts:
-                ctx_tokens = self.embedder.count_tokens(ctx)
+            for ctx, ctx_tokens in zip(contexts, context_tokens):
                 if token_count + ctx_tokens <= self.embedder.max_batch_tokens:
                     limited_contexts.append(ctx)
                     token_count += ctx_tokens
@@ -286,55 +471,34 @@ class VertexReranker:
         if not contexts:
             return []
         
-        # Get embeddings
-        query_emb = self.embedder.embed_query(query)
-        context_embs = self.embedder.embed_documents(contexts, task_type="RETRIEVAL_DOCUMENT")
-        
-        # Convert to numpy arrays and handle edge cases
-        query_emb = np.array(query_emb)
-        context_embs = np.array(context_embs)
+        # Get embeddings (one Vertex round-trip when neither side is cached)
+        query_emb, context_embs = self.embedder.embed_query_and_documents(query, contexts)
         
-        # Check for valid embeddings
+        # Both come back as float32 ndarrays already; just check for valid embeddings
         if context_embs.size == 0 or len(context_embs.shape) != 2:
             print(f"  ⚠️  Invalid context embeddings shape: {context_embs.shape}")
             return []
         
-        # Calculate cosine similarities with safe normalization
-        query_norm = np.linalg.norm(query_emb)
-        if query_norm == 0:
+        if not np.any(query_emb):
             print(f"  ⚠️  Query embedding has zero norm")
             return []
         
-        query_normalized = query_emb / query_norm
-        
-        # Normalize context embeddings
-        context_norms = np.linalg.norm(context_embs, axis=1, keepdims=True)
-        
-        # Handle zero norms in context embeddings
-        zero_norm_mask = context_norms.flatten() == 0
-        if np.any(zero_norm_mask):
-            print(f"  ⚠️  {np.sum(zero_norm_mask)} context embeddings have zero norm, skipping them")
-            # Replace zero norms with 1 to avoid division by zero
-            context_norms[zero_norm_mask] = 1.0
+        # The embedder returns unit vectors, so cosine similarity is a plain
+        # dot product; zero-norm contexts stay zero vectors and score 0
+        similarities = context_embs @ query_emb
         
-        context_normalized = context_embs / context_norms
-        
-        # Compute similarities
-        similarities = np.dot(context_normalized, query_normalized)
-        
-        # Set zero scores for contexts that had zero norm
-        similarities[zero_norm_mask] = 0.0
+        # Order by score descending; for a top_k request, partition out the
+        # best top_k first so only those get sorted and turned into dicts
+        if top_k is not None and top_k < len(similarities):
+            order = np.argpartition(-similarities, top_k)[:top_k]
+            order = order[np.argsort(-similarities[order], kind='stable')]
+        else:
+            order = np.argsort(-similarities, kind='stable')
         
-        # Create results
-        reranked_results = [
-            {"score": float(score), "context": ctx}
-            for score, ctx in zip(similarities, contexts)
+        return [
+            {"score": float(similarities[i]), "context": contexts[i]}
+            for i in order
         ]
-        
-        # Sort by score descending
-        reranked_results.sort(key=lambda x: x['score'], reverse=True)
-        
-        return reranked_results
     
     def compress_context(self, query: str, context: str, threshold: float = 0.5) -> str:
         """
@@ -349,25 +513,19 @@ class VertexReranker:
             Compressed context with only relevant sentences
         """
         # Split into sentences
-        sentences = context.replace('!', '.').replace('?', '.').split('.')
-        sentences = [s.strip() for s in sentences if len(s.strip()) > 10]
+        sentences = [s for s in map(str.strip, _SENTENCE_BOUNDARY_PATTERN.split(context)) if len(s) > 10]
         
         if not sentences:
             return context
         
         # Get embeddings
-        query_emb = self.embedder.embed_query(query)
-        sent_embs = self.embedder.embed_documents(sentences, task_type="RETRIEVAL_DOCUMENT")
-        
-        # Calculate similarities
-        query_norm = query_emb / np.linalg.norm(query_emb)
-        sent_norms = sent_embs / np.linalg.norm(sent_embs, axis=1, keepdims=True)
-        similarities = np.dot(sent_norms, query_norm)
-        
-        # Keep sentences above threshold
-        relevant_sentences = [
-            sent for sent, score in zip(sentences, similarities)
-            if score > threshold
-        ]
+        query_emb, sent_embs = self.embedder.embed_query_and_documents(query, sentences)
+        
+        # Calculate similarities (embeddings are unit vectors)
+        similarities = sent_embs @ query_emb
+        
+        # Keep sentences above threshold (mask in numpy, then pick only the kept ones)
+        kept = np.flatnonzero(similarities > threshold).tolist()
+        relevant_sentences = [sentences[i] for i in kept]
         
         return '. '.join(relevant_sentences) + '.' if relevant_sentences else context